@@ -0,0 +1,49 @@
+"""
+Synthetic PDF corpus for load tests and extraction benchmarks.
+
+    python -m bench.corpus [DIRECTORY]        # defaults to bench/corpus
+
+Unlike bench/fixtures, the corpus is generated on demand (and ignored by git):
+lab reports from 1 to 60 pages in ruled, plain and mixed layouts, with SI and
+conventional units.
+"""
+import os
+import sys
+
+from bench.pdfgen import lab_report
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+PAGE_COUNTS = (1, 2, 5, 10, 30, 60)
+LAYOUTS = ("ruled", "plain", "mixed")
+
+
+def corpus_spec(page_counts=PAGE_COUNTS, layouts=LAYOUTS) -> dict:
+    """File name -> lab_report() arguments; a third of the documents, across layouts, use conventional units."""
+    spec = {}
+    for i, pages in enumerate(page_counts):
+        for j, layout in enumerate(layouts):
+            units = "conventional" if (i + j) % 3 == 2 else "si"
+            spec[f"{layout}_{pages:02d}p_{units}.pdf"] = dict(
+                pages=pages, layout=layout, seed=100 + i * len(layouts) + j, units=units
+            )
+    return spec
+
+
+def write_corpus(directory: str = CORPUS_DIR, page_counts=PAGE_COUNTS, layouts=LAYOUTS) -> list:
+    """Writes missing corpus files and returns all their paths, smallest first."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, params in corpus_spec(page_counts, layouts).items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(lab_report(**params))
+        paths.append(path)
+    return sorted(paths, key=os.path.getsize)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else CORPUS_DIR
+    paths = write_corpus(directory)
+    print(f"{len(paths)} PDFs in {directory}")
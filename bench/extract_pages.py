@@ -0,0 +1,70 @@
+"""
+Per-page pdfplumber extraction micro-benchmark.
+
+    python -m bench.extract_pages [PDF ...] [--repeat 3] [--max-page-ms 50]
+
+Runs the same job the PDF pool workers run (memory-mapped file, pages parsed
+one by one and flushed) on bench/fixtures and the synthetic corpus, in both
+modes: plain extract_text() ("raw" prompts) and table-aware extraction
+("compact" prompts). With --max-page-ms, exits with status 1 when the p95
+time per page in table mode is over budget.
+"""
+import argparse
+import glob
+import os
+import sys
+
+from bench.corpus import write_corpus
+from bench.pdfgen import FIXTURES_DIR
+from bench.stats import percentile
+from pdf_pool import extract_range_job
+
+
+def measure(path: str, repeat: int) -> dict:
+    row = {"file": os.path.basename(path), "open": [], "text": [], "tables": []}
+    for _ in range(repeat):
+        for mode, tables in (("text", False), ("tables", True)):
+            texts, page_seconds, open_seconds = extract_range_job(path, 0, None, tables, 0)
+            row["open"].append(open_seconds)
+            row[mode].extend(page_seconds)
+    row["pages"] = len(texts)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pdfplumber per-page extraction benchmark")
+    parser.add_argument("paths", nargs="*", help="PDFs to measure (default: fixtures and corpus)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-page-ms", type=float, help="p95 budget per page in table mode")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.pdf"))) + write_corpus()
+
+    header = (f"{'file':<30} {'pages':>5} {'open ms':>8} {'text ms/page p50/p95':>21} "
+              f"{'tables ms/page p50/p95':>23} {'pages/s':>8}")
+    print(header)
+    print("-" * len(header))
+
+    all_text, all_tables = [], []
+    for path in paths:
+        row = measure(path, args.repeat)
+        all_text.extend(row["text"])
+        all_tables.extend(row["tables"])
+        tables_total = sum(row["tables"]) / args.repeat
+        print(f"{row['file']:<30} {row['pages']:>5} {percentile(row['open'], 0.5) * 1000:>8.1f} "
+              f"{percentile(row['text'], 0.5) * 1000:>10.2f}/{percentile(row['text'], 0.95) * 1000:<10.2f} "
+              f"{percentile(row['tables'], 0.5) * 1000:>11.2f}/{percentile(row['tables'], 0.95) * 1000:<11.2f} "
+              f"{row['pages'] / tables_total if tables_total else 0:>8.1f}")
+
+    text_p95 = percentile(all_text, 0.95) * 1000
+    tables_p95 = percentile(all_tables, 0.95) * 1000
+    print(f"\nAll pages: text p50 {percentile(all_text, 0.5) * 1000:.2f} ms, p95 {text_p95:.2f} ms; "
+          f"tables p50 {percentile(all_tables, 0.5) * 1000:.2f} ms, p95 {tables_p95:.2f} ms")
+
+    if args.max_page_ms is not None and tables_p95 > args.max_page_ms:
+        print(f"FAIL: tables p95 {tables_p95:.2f} ms/page is over the {args.max_page_ms} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
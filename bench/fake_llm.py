@@ -0,0 +1,239 @@
+"""
+Local fake of the Gemini REST and OpenAI chat completion APIs.
+
+    python -m bench.fake_llm --port 8090 --latency 0.8 --error-rate 0.02
+
+Point the service at it with
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8090        (Gemini SDK, REST transport)
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1         (openai package)
+
+Every call sleeps `latency` seconds plus up to `jitter`; `tail_rate` of the
+calls take `tail_latency` instead, to give hedging something to cut. A share
+`error_rate` of the calls fails with 503 (or 429 with --rate-limit).
+Streaming answers arrive in `chunks` pieces spread over the same latency.
+GET /stats returns request and error counts.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_GEMINI_PATH = re.compile(r"^/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)")
+
+_ANSWER = (
+    "Общая оценка: большинство показателей в пределах референсных значений. "
+    "Отклонения: повышенный уровень С-реактивного белка указывает на воспалительный процесс, "
+    "сниженный гемоглобин может говорить о железодефицитной анемии. "
+    "Рекомендации: повторить общий анализ крови через две недели, определить ферритин и "
+    "сывороточное железо, обратиться к терапевту для очной консультации. "
+)
+
+
+class FakeLLM:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, tail_rate: float = 0.0,
+                 tail_latency: float = 5.0, error_rate: float = 0.0, rate_limit: bool = False,
+                 chunks: int = 8, answer_chars: int = 1500, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.chunks = max(1, chunks)
+        self.answer = (_ANSWER * (answer_chars // len(_ANSWER) + 1))[:answer_chars]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "tail": 0, "prompt_chars": 0}
+
+    def plan(self, prompt_chars: int) -> tuple:
+        """Returns (latency, error status or None) for one call."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_chars"] += prompt_chars
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return self._random.uniform(0, self.latency), 429 if self.rate_limit else 503
+            if self._random.random() < self.tail_rate:
+                self.stats["tail"] += 1
+                return self.tail_latency, None
+            return self.latency + self._random.uniform(0, self.jitter), None
+
+    def pieces(self) -> list:
+        size = -(-len(self.answer) // self.chunks)
+        return [self.answer[i:i + size] for i in range(0, len(self.answer), size)]
+
+
+def _gemini_chunk(text: str, prompt_chars: int, last: bool) -> dict:
+    chunk = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+    if last:
+        chunk["candidates"][0]["finishReason"] = "STOP"
+        chunk["usageMetadata"] = {"promptTokenCount": prompt_chars // 4, "candidatesTokenCount": len(text) // 4,
+                                  "totalTokenCount": (prompt_chars + len(text)) // 4}
+    return chunk
+
+
+def _openai_completion(model: str, text: str, prompt_chars: int) -> dict:
+    return {
+        "id": f"chatcmpl-fake{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(text) // 4,
+                  "total_tokens": (prompt_chars + len(text)) // 4},
+    }
+
+
+def _openai_chunk(model: str, delta: dict, finish_reason: str = None, usage: dict = None) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+        "usage": usage,
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    llm = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _error(self, status: int, openai_format: bool):
+        message = "Rate limit exceeded" if status == 429 else "The model is overloaded"
+        if openai_format:
+            self._json(status, {"error": {"message": message, "type": "server_error", "code": None}})
+        else:
+            self._json(status, {"error": {"code": status, "message": message,
+                                          "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}})
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._json(200, self.llm.stats)
+        else:
+            self._json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        request = json.loads(body or b"{}")
+        gemini = _GEMINI_PATH.match(self.path)
+        if gemini:
+            prompt = "".join(part.get("text", "") for content in request.get("contents", [])
+                             for part in content.get("parts", []))
+            self._serve(len(prompt), gemini.group(2) == "streamGenerateContent", gemini=True)
+        elif self.path.startswith("/v1/chat/completions"):
+            prompt = "".join(str(message.get("content", "")) for message in request.get("messages", []))
+            self._serve(len(prompt), bool(request.get("stream")), gemini=False, model=request.get("model", "fake"))
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _serve(self, prompt_chars: int, stream: bool, gemini: bool, model: str = None):
+        latency, error = self.llm.plan(prompt_chars)
+        if error:
+            time.sleep(latency)
+            self._error(error, openai_format=not gemini)
+            return
+        if not stream:
+            time.sleep(latency)
+            if gemini:
+                self._json(200, _gemini_chunk(self.llm.answer, prompt_chars, last=True))
+            else:
+                self._json(200, _openai_completion(model, self.llm.answer, prompt_chars))
+            return
+
+        pieces = self.llm.pieces()
+        delay = latency / (len(pieces) + 1)
+        time.sleep(delay)
+        if gemini:
+            # the SDK's REST transport reads a streamed JSON array
+            self._start_stream("application/json")
+            for i, piece in enumerate(pieces):
+                prefix = b"[" if i == 0 else b",\r\n"
+                chunk = _gemini_chunk(piece, prompt_chars, last=i == len(pieces) - 1)
+                self._write_chunk(prefix + json.dumps(chunk, ensure_ascii=False).encode("utf-8"))
+                time.sleep(delay)
+            self._write_chunk(b"]")
+        else:
+            self._start_stream("text/event-stream")
+            events = [_openai_chunk(model, {"role": "assistant", "content": pieces[0]})]
+            events += [_openai_chunk(model, {"content": piece}) for piece in pieces[1:]]
+            events.append(_openai_chunk(model, {}, finish_reason="stop"))
+            events.append(_openai_chunk(model, {}, usage={"prompt_tokens": prompt_chars // 4,
+                                                           "completion_tokens": len(self.llm.answer) // 4,
+                                                           "total_tokens": (prompt_chars + len(self.llm.answer)) // 4}))
+            for event in events:
+                self._write_chunk(b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                time.sleep(delay / 2)
+            self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+
+def serve(llm: FakeLLM, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Starts the server in a daemon thread; the bound port is `server.server_address[1]`."""
+    handler = type("FakeHandler", (Handler,), {"llm": llm})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser, prefix: str = ""):
+    parser.add_argument(f"--{prefix}latency", type=float, default=0.5, help="seconds per call")
+    parser.add_argument(f"--{prefix}jitter", type=float, default=0.2, help="extra random seconds per call")
+    parser.add_argument(f"--{prefix}tail-rate", type=float, default=0.0, help="share of calls that take --tail-latency")
+    parser.add_argument(f"--{prefix}tail-latency", type=float, default=5.0)
+    parser.add_argument(f"--{prefix}error-rate", type=float, default=0.0, help="share of calls that fail")
+    parser.add_argument(f"--{prefix}rate-limit", action="store_true", help="fail with 429 instead of 503")
+    parser.add_argument(f"--{prefix}chunks", type=int, default=8, help="pieces per streamed answer")
+    parser.add_argument(f"--{prefix}answer-chars", type=int, default=1500)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini/OpenAI server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--seed", type=int)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    llm = FakeLLM(latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate,
+                  tail_latency=args.tail_latency, error_rate=args.error_rate, rate_limit=args.rate_limit,
+                  chunks=args.chunks, answer_chars=args.answer_chars, seed=args.seed)
+    server = serve(llm, args.host, args.port)
+    print(f"Fake LLM listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
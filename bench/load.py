@@ -0,0 +1,403 @@
+"""
+Offline load test for the API.
+
+Starts the fake LLM server (bench/fake_llm.py) and `python main.py` with N
+uvicorn workers, then drives the chosen endpoints at each concurrency level:
+
+    python -m bench.load --workers 2 --concurrency 1,8,32 --requests 200
+    python -m bench.load --endpoint test_gemini --concurrency 64 --llm-latency 0.3 --llm-tail-rate 0.05
+    python -m bench.load --backends gemini,stub --env LLM_HEDGE=1 --llm-tail-rate 0.05
+
+Reports requests/s, p50/p95/p99 latency and errors per level, and the peak
+RSS of every uvicorn worker together with its PDF extraction processes
+(read from /proc, so RSS is only reported on Linux). The analysis cache is
+off unless --cache is given, so every /analyze request is extracted and sent
+to the fake LLM. --max-p95, --max-p99, --min-rps and --max-error-rate turn
+the run into a check: the exit status is 1 when a level is over budget.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from bench.corpus import PAGE_COUNTS, write_corpus
+from bench.fake_llm import add_arguments as add_llm_arguments
+from bench.stats import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ("analyze", "analyze_stream", "test_gemini")
+
+
+# --- processes ---------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float, process: subprocess.Popen):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[1:3]} exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def start_fake_llm(args, port: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "bench.fake_llm", "--port", str(port),
+               "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter),
+               "--tail-rate", str(args.llm_tail_rate), "--tail-latency", str(args.llm_tail_latency),
+               "--error-rate", str(args.llm_error_rate), "--chunks", str(args.llm_chunks),
+               "--answer-chars", str(args.llm_answer_chars)]
+    if args.llm_rate_limit:
+        command.append("--rate-limit")
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+    wait_for(f"http://127.0.0.1:{port}/stats", 30, process)
+    return process
+
+
+def start_server(args, port: int, llm_url: str, workdir: str, log) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY="offline-benchmark",
+        GEMINI_API_ENDPOINT=llm_url,
+        OPENAI_API_KEY="offline-benchmark",
+        OPENAI_BASE_URL=f"{llm_url}/v1",
+        LLM_BACKENDS=args.backends,
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, "metrics"),
+        JOBS_DIR=os.path.join(workdir, "jobs"),
+        UPLOAD_DIR=workdir,
+    )
+    if not args.cache:
+        env.update(CACHE_DB_PATH="", CACHE_MAX_ENTRIES="0")
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+    os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+    command = [sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers)]
+    if args.pdf_workers:
+        command += ["--pdf-workers", str(args.pdf_workers)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wait_for(f"http://127.0.0.1:{port}/health", 120, process)
+    return process
+
+
+# --- memory ------------------------------------------------------------------
+
+def _read(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _children() -> dict:
+    children = {}
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            stat = _read(f"/proc/{name}/stat")
+            if stat:
+                # the command name may contain spaces, ppid is the second field after it
+                ppid = int(stat.rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def _descendants(pid: int, children: dict) -> list:
+    found = []
+    for child in children.get(pid, []):
+        if "resource_tracker" not in _read(f"/proc/{child}/cmdline"):
+            found.append(child)
+            found.extend(_descendants(child, children))
+    return found
+
+
+def _peak_kb(pid: int) -> int:
+    for line in _read(f"/proc/{pid}/status").splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    return 0
+
+
+class RssMonitor(threading.Thread):
+    """Samples the peak RSS (VmHWM) of the server's processes while a level runs."""
+
+    def __init__(self, server_pid: int, workers: int, interval: float = 0.25):
+        super().__init__(name="rss-monitor", daemon=True)
+        self.server_pid = server_pid
+        self.workers = workers
+        self.interval = interval
+        self.enabled = os.path.exists(f"/proc/{server_pid}/status")
+        self._peaks = {}
+        self._tree = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def worker_pids(self, children: dict = None) -> list:
+        children = _children() if children is None else children
+        if self.workers == 1:
+            return [self.server_pid]
+        return [pid for pid in children.get(self.server_pid, [])
+                if "resource_tracker" not in _read(f"/proc/{pid}/cmdline")]
+
+    def sample(self):
+        children = _children()
+        tree = {pid: _descendants(pid, children) for pid in self.worker_pids(children)}
+        with self._lock:
+            self._tree = tree
+            for pid in itertools.chain(tree, *tree.values()):
+                self._peaks[pid] = max(self._peaks.get(pid, 0), _peak_kb(pid))
+
+    def reset(self):
+        """Starts a new measurement; resets the kernel's high-water mark where allowed."""
+        with self._lock:
+            pids = list(itertools.chain(self._tree, *self._tree.values()))
+            self._peaks = {}
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/clear_refs", "w") as f:
+                    f.write("5")
+            except OSError:
+                pass
+
+    def run(self):
+        while self.enabled and not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stopped.set()
+
+    def report(self) -> list:
+        if not self.enabled:
+            return []
+        self.sample()
+        with self._lock:
+            return [{
+                "pid": pid,
+                "worker_mb": round(self._peaks.get(pid, 0) / 1024, 1),
+                "pdf_processes": len(pool),
+                "pdf_pool_mb": round(sum(self._peaks.get(child, 0) for child in pool) / 1024, 1),
+            } for pid, pool in self._tree.items()]
+
+
+# --- load --------------------------------------------------------------------
+
+def multipart(filename: str, data: bytes) -> tuple:
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def build_requests(endpoint: str, pdfs: list) -> list:
+    """Returns (method, path, body, headers) tuples that workers cycle through."""
+    if endpoint == "test_gemini":
+        text = urllib.parse.quote("Гемоглобин 160 г/л, лейкоциты 12.0, СРБ 30 мг/л. Что это значит?")
+        return [("POST", f"/test_gemini?text={text}", b"", {})]
+    requests = []
+    for path in pdfs:
+        with open(path, "rb") as f:
+            body, content_type = multipart(os.path.basename(path), f.read())
+        headers = {"Content-Type": content_type}
+        if endpoint == "analyze_stream":
+            headers["Accept"] = "text/event-stream"
+        requests.append(("POST", "/analyze", body, headers))
+    return requests
+
+
+def run_level(port: int, requests: list, concurrency: int, count: int, timeout: float) -> dict:
+    jobs = queue.Queue()
+    for i in range(count):
+        jobs.put(requests[i % len(requests)])
+    results = []
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        while True:
+            try:
+                method, path, body, headers = jobs.get_nowait()
+            except queue.Empty:
+                break
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                status = response.status
+                # a stream reports failures as an error event after a 200
+                if status == 200 and b"event: error" in data:
+                    status = int(json.loads(data.split(b"event: error\ndata: ", 1)[1].split(b"\n", 1)[0])["status"])
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+                status = 0
+            with lock:
+                results.append((time.perf_counter() - started, status))
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ok = [seconds for seconds, status in results if 200 <= status < 300]
+    errors = {}
+    for _, status in results:
+        if not 200 <= status < 300:
+            errors[status] = errors.get(status, 0) + 1
+    return {
+        "requests": len(results),
+        "seconds": elapsed,
+        "rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency": summarize(ok),
+        "errors": errors,
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+    }
+
+
+def check_budgets(args, endpoint: str, concurrency: int, level: dict) -> list:
+    failures = []
+    latency = level["latency"]
+    if args.max_p95 is not None and latency["p95"] > args.max_p95:
+        failures.append(f"p95 {latency['p95']:.3f}s > {args.max_p95}s")
+    if args.max_p99 is not None and latency["p99"] > args.max_p99:
+        failures.append(f"p99 {latency['p99']:.3f}s > {args.max_p99}s")
+    if args.min_rps is not None and level["rps"] < args.min_rps:
+        failures.append(f"{level['rps']:.2f} rps < {args.min_rps}")
+    if args.max_error_rate is not None and level["error_rate"] > args.max_error_rate:
+        failures.append(f"error rate {level['error_rate']:.1%} > {args.max_error_rate:.1%}")
+    return [f"{endpoint} @ {concurrency}: {failure}" for failure in failures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against uvicorn and a fake LLM")
+    parser.add_argument("--endpoint", default="analyze",
+                        help=f"comma-separated, any of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per level")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests before each level")
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request, seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--pdf-workers", type=int, help="PDF extraction processes per uvicorn worker")
+    parser.add_argument("--backends", default="gemini", help="LLM_BACKENDS for the server")
+    parser.add_argument("--max-pages", type=int, default=10, help="largest corpus documents to upload")
+    parser.add_argument("--cache", action="store_true", help="keep the analysis cache on")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the server, e.g. LLM_HEDGE=1")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-p95", type=float, help="budget, seconds")
+    parser.add_argument("--max-p99", type=float, help="budget, seconds")
+    parser.add_argument("--min-rps", type=float, help="budget, successful requests per second")
+    parser.add_argument("--max-error-rate", type=float, help="budget, 0..1")
+    add_llm_arguments(parser, prefix="llm-")
+    args = parser.parse_args()
+
+    endpoints = args.endpoint.split(",")
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoint: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    pdfs = write_corpus(page_counts=[p for p in PAGE_COUNTS if p <= args.max_pages])
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    log_path = os.path.join(workdir, "server.log")
+    llm_port, server_port = free_port(), free_port()
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    print(f"{len(pdfs)} corpus PDFs, {args.workers} uvicorn worker(s), backends {args.backends}, "
+          f"fake LLM latency {args.llm_latency}s, server log {log_path}")
+
+    results = []
+    failures = []
+    fake_llm = start_fake_llm(args, llm_port)
+    with open(log_path, "wb") as log:
+        server = None
+        try:
+            server = start_server(args, server_port, llm_url, workdir, log)
+            monitor = RssMonitor(server.pid, args.workers)
+            # with several workers /health may answer before all of them are up
+            deadline = time.monotonic() + 60
+            while monitor.enabled and len(monitor.worker_pids()) < args.workers and time.monotonic() < deadline:
+                time.sleep(0.2)
+            monitor.start()
+
+            header = (f"{'endpoint':<15} {'conc':>5} {'requests':>8} {'rps':>8} {'p50 s':>7} {'p95 s':>7} "
+                      f"{'p99 s':>7} {'max s':>7} {'errors':>7}  peak RSS MB per worker (+ PDF pool)")
+            print(header)
+            print("-" * len(header))
+            for endpoint in endpoints:
+                requests = build_requests(endpoint, pdfs)
+                for concurrency in levels:
+                    if args.warmup:
+                        run_level(server_port, requests, concurrency, args.warmup, args.timeout)
+                    monitor.reset()
+                    level = run_level(server_port, requests, concurrency, args.requests, args.timeout)
+                    level.update(endpoint=endpoint, concurrency=concurrency, rss=monitor.report())
+                    results.append(level)
+                    failures += check_budgets(args, endpoint, concurrency, level)
+
+                    latency = level["latency"]
+                    errors = sum(level["errors"].values())
+                    rss = ", ".join(f"{w['worker_mb']:.0f} (+{w['pdf_pool_mb']:.0f})" for w in level["rss"]) or "n/a"
+                    print(f"{endpoint:<15} {concurrency:>5} {level['requests']:>8} {level['rps']:>8.2f} "
+                          f"{latency['p50']:>7.3f} {latency['p95']:>7.3f} {latency['p99']:>7.3f} "
+                          f"{latency['max']:>7.3f} {errors:>7}  {rss}")
+                    if level["errors"]:
+                        print(f"{'':<15} errors by status: {level['errors']}")
+            monitor.stop()
+        finally:
+            if server is not None:
+                stop(server)
+            try:
+                with urllib.request.urlopen(f"{llm_url}/stats", timeout=2) as response:
+                    print(f"\nFake LLM: {json.load(response)}")
+            except OSError:
+                pass
+            stop(fake_llm)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
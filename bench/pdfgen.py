@@ -0,0 +1,225 @@
+"""
+Minimal PDF writer and synthetic lab-report generator.
+
+Produces small text PDFs (Helvetica, WinAnsi encoding) without any third-party
+dependency, so fixtures can be regenerated anywhere:
+
+    python -m bench.pdfgen            # rewrites bench/fixtures/*.pdf
+"""
+import os
+import random
+import zlib
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _escape(text: str) -> bytes:
+    data = text.encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class PdfPage:
+    def __init__(self):
+        self._ops = []
+
+    def text(self, x: float, y: float, text: str, size: float = 9, bold: bool = False):
+        font = b"F2" if bold else b"F1"
+        self._ops.append(b"BT /%s %g Tf %g %g Td (%s) Tj ET" % (font, size, x, y, _escape(text)))
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, width: float = 0.5):
+        self._ops.append(b"%g w %g %g m %g %g l S" % (width, x1, y1, x2, y2))
+
+    def content(self) -> bytes:
+        return b"\n".join(self._ops)
+
+
+class PdfWriter:
+    def __init__(self, compress: bool = True):
+        self.compress = compress
+        self.pages = []
+
+    def add_page(self) -> PdfPage:
+        page = PdfPage()
+        self.pages.append(page)
+        return page
+
+    def to_bytes(self) -> bytes:
+        # 1 catalog, 2 page tree, 3-4 fonts, then a page and its content per page
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            None,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        ]
+        kids = []
+        for page in self.pages:
+            content = page.content()
+            if self.compress:
+                content = zlib.compress(content)
+                header = b"<< /Length %d /Filter /FlateDecode >>" % len(content)
+            else:
+                header = b"<< /Length %d >>" % len(content)
+            objects.append(header + b"\nstream\n" + content + b"\nendstream")
+            content_ref = len(objects)
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R"
+                b" /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>"
+                % (PAGE_WIDTH, PAGE_HEIGHT, content_ref)
+            )
+            kids.append(b"%d 0 R" % len(objects))
+        objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        for offset in offsets:
+            out += b"%010d 00000 n \n" % offset
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+        return bytes(out)
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+# --- Synthetic lab reports ---------------------------------------------------
+
+# name, unit, low, high
+ANALYTES = [
+    ("Hemoglobin", "g/L", 130, 170),
+    ("Hematocrit", "%", 40, 50),
+    ("Erythrocytes (RBC)", "x10^12/L", 4.3, 5.7),
+    ("Leukocytes (WBC)", "x10^9/L", 4.0, 9.0),
+    ("Platelets", "x10^9/L", 150, 400),
+    ("MCV", "fL", 80, 100),
+    ("MCH", "pg", 27, 34),
+    ("Neutrophils", "%", 47, 72),
+    ("Lymphocytes", "%", 19, 37),
+    ("Monocytes", "%", 3, 11),
+    ("ESR", "mm/h", 2, 15),
+    ("Glucose", "mmol/L", 3.9, 6.1),
+    ("Total cholesterol", "mmol/L", 3.0, 5.2),
+    ("LDL cholesterol", "mmol/L", 0, 3.0),
+    ("HDL cholesterol", "mmol/L", 1.0, 2.2),
+    ("Triglycerides", "mmol/L", 0, 1.7),
+    ("Creatinine", "umol/L", 62, 106),
+    ("Urea", "mmol/L", 2.8, 7.2),
+    ("ALT", "U/L", 0, 41),
+    ("AST", "U/L", 0, 40),
+    ("Total bilirubin", "umol/L", 3.4, 20.5),
+    ("C-reactive protein", "mg/L", 0, 5),
+    ("Ferritin", "ng/mL", 30, 400),
+    ("TSH", "mIU/L", 0.4, 4.0),
+    ("Sodium", "mmol/L", 136, 145),
+    ("Potassium", "mmol/L", 3.5, 5.1),
+]
+
+HEADER = [
+    "CityLab Diagnostics - Certified Medical Laboratory",
+    "12 Pushkin Street, Bishkek 720001 | tel. +996 312 000 000 | www.citylab.example",
+    "Patient: Ivanov I.I.   Sex: M   Date of birth: 14.05.1979   Order no. 4471923",
+]
+FOOTER = [
+    "Methods: haematology - flow cytometry (Sysmex XN-1000); biochemistry - photometry (Cobas c311);",
+    "hormones - electrochemiluminescence immunoassay (Cobas e411). Reference ranges are given for adults.",
+    "Results relate only to the sample tested. This report is not a diagnosis; consult your physician.",
+    "Laboratory director: Dr. A. Petrova. Accreditation KG-LAB-0042. Printed by LIS v4.2 on 18.03.2024 09:14.",
+]
+
+
+def _measurement(rng: random.Random, low: float, high: float):
+    span = high - low or high or 1
+    value = rng.uniform(low - span * 0.3, high + span * 0.3)
+    value = max(value, 0)
+    decimals = 0 if high >= 100 else 1 if high >= 10 else 2
+    return round(value, decimals), decimals
+
+
+def lab_report(pages: int, layout: str = "ruled", seed: int = 0, units: str = "si") -> bytes:
+    """
+    Builds a lab report with the given number of pages.
+
+    layout: "ruled" draws table grid lines (found by pdfplumber's table finder),
+            "plain" only aligns columns with spaces,
+            "mixed" alternates the two, starting with a ruled page.
+    units:  "si" or "conventional" (g/dL, mg/dL) to exercise unit conversion.
+    """
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    columns = (50, 250, 330, 410, 510)
+
+    for number in range(1, pages + 1):
+        page = writer.add_page()
+        y = PAGE_HEIGHT - 50
+        for i, line in enumerate(HEADER):
+            page.text(50, y, line, size=11 if i == 0 else 8, bold=i == 0)
+            y -= 14
+        y -= 10
+        page.text(50, y, f"Panel {number}: {rng.choice(['Complete blood count', 'Biochemistry', 'Hormones'])}",
+                  size=10, bold=True)
+        y -= 20
+
+        headings = ("Test", "Result", "Units", "Reference range", "Flag")
+        for x, heading in zip(columns, headings):
+            page.text(x + 3, y, heading, bold=True)
+        rows_top = y + 12
+        y -= 16
+
+        for name, unit, low, high in rng.sample(ANALYTES, 18):
+            value, decimals = _measurement(rng, low, high)
+            if units == "conventional" and unit == "g/L":
+                unit, value, low, high = "g/dL", round(value / 10, 1), low / 10, high / 10
+            flag = "H" if value > high else "L" if value < low else ""
+            reference = f"< {high:g}" if low == 0 else f"{low:g} - {high:g}"
+            cells = (name, f"{value:.{decimals}f}", unit, reference, flag)
+            for x, cell in zip(columns, cells):
+                page.text(x + 3, y, cell)
+            y -= 16
+
+        if layout == "ruled" or layout == "mixed" and number % 2:
+            right = 560
+            row_y = rows_top
+            while row_y >= y + 12:
+                page.line(columns[0], row_y, right, row_y)
+                row_y -= 16
+            for x in columns + (right,):
+                page.line(x, rows_top, x, row_y + 16)
+
+        y -= 12
+        page.text(50, y, f"Comment: sample {rng.randint(100000, 999999)} received {rng.randint(1, 28):02d}.03.2024,"
+                         " analysed within 4 hours of collection.", size=8)
+        y = 90
+        for line in FOOTER:
+            page.text(50, y, line, size=7)
+            y -= 10
+        page.text(PAGE_WIDTH - 100, 30, f"Page {number} of {pages}", size=8)
+
+    return writer.to_bytes()
+
+
+FIXTURES = {
+    "cbc_ruled_1p.pdf": dict(pages=1, layout="ruled", seed=1),
+    "panel_ruled_4p.pdf": dict(pages=4, layout="ruled", seed=2),
+    "panel_plain_4p.pdf": dict(pages=4, layout="plain", seed=3),
+    "panel_conventional_3p.pdf": dict(pages=3, layout="plain", seed=4, units="conventional"),
+    "archive_ruled_20p.pdf": dict(pages=20, layout="ruled", seed=5),
+}
+
+
+def write_fixtures(directory: str = FIXTURES_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name, params in FIXTURES.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(lab_report(**params))
+
+
+if __name__ == "__main__":
+    write_fixtures()
+    print(f"Wrote {len(FIXTURES)} fixtures to {FIXTURES_DIR}")
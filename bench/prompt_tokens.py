@@ -0,0 +1,78 @@
+"""
+Prompt size benchmark: raw page text vs the compact lab-result format.
+
+    python -m bench.prompt_tokens [PDF ...]       # defaults to bench/fixtures/*.pdf
+
+Token counts are offline estimates (Gemini's tokenizer needs an API call):
+"tokens" counts words and punctuation marks, which tracks SentencePiece
+token counts closely enough to compare two formats of the same text.
+"""
+import glob
+import os
+import re
+import sys
+import time
+
+import pdfplumber
+
+import lab_results
+from bench.pdfgen import FIXTURES_DIR
+from pdf_pool import iter_page_texts
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(_TOKEN_RE.findall(text))
+
+
+def measure(path: str) -> dict:
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+        started = time.perf_counter()
+        raw_pages = list(iter_page_texts(pdf, 0, page_count))
+        raw_seconds = time.perf_counter() - started
+
+    with pdfplumber.open(path) as pdf:
+        started = time.perf_counter()
+        table_pages = list(iter_page_texts(pdf, 0, page_count, tables=True))
+        compact, result_count = lab_results.compact_text(table_pages)
+        compact_seconds = time.perf_counter() - started
+
+    raw = "".join(text + "\n" for text in raw_pages if text)
+    return {
+        "file": os.path.basename(path),
+        "pages": page_count,
+        "raw_chars": len(raw),
+        "raw_tokens": estimate_tokens(raw),
+        "compact_chars": len(compact),
+        "compact_tokens": estimate_tokens(compact),
+        "results": result_count,
+        "raw_ms": raw_seconds * 1000,
+        "compact_ms": compact_seconds * 1000,
+    }
+
+
+def main(paths: list):
+    paths = paths or sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.pdf")))
+    header = (f"{'file':<28} {'pages':>5} {'raw chars':>9} {'raw tok':>8} {'compact chars':>13} "
+              f"{'compact tok':>11} {'saved':>6} {'results':>7} {'extract ms raw/compact':>22}")
+    print(header)
+    print("-" * len(header))
+
+    total_raw = total_compact = 0
+    for path in paths:
+        row = measure(path)
+        total_raw += row["raw_tokens"]
+        total_compact += row["compact_tokens"]
+        saved = 1 - row["compact_tokens"] / row["raw_tokens"] if row["raw_tokens"] else 0
+        print(f"{row['file']:<28} {row['pages']:>5} {row['raw_chars']:>9} {row['raw_tokens']:>8} "
+              f"{row['compact_chars']:>13} {row['compact_tokens']:>11} {saved:>6.1%} {row['results']:>7} "
+              f"{row['raw_ms']:>11.1f}/{row['compact_ms']:<10.1f}")
+
+    if total_raw:
+        print(f"\nTotal: {total_raw} -> {total_compact} tokens ({1 - total_compact / total_raw:.1%} fewer)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
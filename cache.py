@@ -0,0 +1,275 @@
+"""
+Two-tier cache for extracted PDF text and Gemini analyses.
+
+Entries live in an in-memory LRU (bounded by entry count, total size and TTL),
+optionally in front of a SQLite file shared by all uvicorn workers on the host
+(CACHE_DB_PATH; off by default, since it keeps analyses on disk). Invalidations
+are also written to a small marker file that every worker checks on memory
+hits, so DELETE /admin/cache applies to all workers, not only the one that
+handled it.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_hex(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_key(pdf_hash: str, variant: str) -> str:
+    # variant covers the prompt format and extraction budget the text was built with
+    return f"text:{pdf_hash}:{variant}"
+
+
+def analysis_key(pdf_hash: str, prompt_version: str, model_name: str) -> str:
+    return f"analysis:{pdf_hash}:{prompt_version}:{model_name}"
+
+
+# Expired rows are purged and the size limit enforced every this many disk writes
+DISK_PRUNE_EVERY = 100
+
+
+class AnalysisCache:
+    def __init__(self, db_path: str = None, max_entries: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600,
+                 disk_ttl: float = 7 * 24 * 3600, disk_max_bytes: int = 256 * 1024 * 1024,
+                 marker_path: str = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self.disk_max_bytes = disk_max_bytes
+        self.marker_path = marker_path
+
+        # key -> (value, expires_at, prompt_version, created_at wall clock)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Lookups are counted per key kind ("text", "analysis"): one upload does both
+        self._stats = {
+            kind: {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+            for kind in ("text", "analysis")
+        }
+        self._stats.update(evictions=0, expirations=0, invalidations=0)
+        # (time, prompt_version or None) read from the marker file, and its mtime
+        self._invalidations = []
+        self._marker_mtime = None
+        self._disk_writes = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " prompt_version TEXT,"
+                " created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_prompt_version ON entries (prompt_version)")
+            self._db.commit()
+            self._disk_prune()
+            logger.info(f"Analysis cache backed by {db_path}")
+
+    @classmethod
+    def from_env(cls) -> "AnalysisCache":
+        return cls(
+            db_path=os.getenv("CACHE_DB_PATH") or None,
+            max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.getenv("CACHE_TTL", "3600")),
+            disk_ttl=float(os.getenv("CACHE_DISK_TTL", str(7 * 24 * 3600))),
+            disk_max_bytes=int(os.getenv("CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024))),
+            marker_path=os.getenv("CACHE_INVALIDATION_PATH", "analysis_cache.invalidations") or None,
+        )
+
+    def _count(self, key: str, stat: str):
+        self._stats[key.split(":", 1)[0]][stat] += 1
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    # --- memory tier ---------------------------------------------------------
+
+    def _memory_get(self, key: str):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, expires_at, prompt_version, created_at = entry
+        if expires_at < time.monotonic():
+            self._memory_drop(key)
+            self._stats["expirations"] += 1
+            return None
+        if self._invalidated(prompt_version, created_at):
+            self._memory_drop(key)
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: str, prompt_version: str = None, created_at: float = None):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_drop(key)
+        self._memory[key] = (value, time.monotonic() + self.ttl, prompt_version, created_at or time.time())
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._memory_drop(oldest)
+            self._stats["evictions"] += 1
+
+    def _memory_drop(self, key: str):
+        value = self._memory.pop(key)[0]
+        self._memory_bytes -= len(value.encode("utf-8"))
+
+    # --- invalidation marker -------------------------------------------------
+
+    def _invalidated(self, prompt_version: str, created_at: float) -> bool:
+        """True if another worker invalidated this entry after it was cached."""
+        if self.marker_path is None:
+            return False
+        try:
+            mtime = os.stat(self.marker_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime != self._marker_mtime:
+            self._invalidations = self._read_marker()
+            self._marker_mtime = mtime
+        return any(
+            at >= created_at and (version is None or version == prompt_version)
+            for at, version in self._invalidations
+        )
+
+    def _read_marker(self) -> list:
+        try:
+            with open(self.marker_path) as f:
+                return [tuple(item) for item in json.load(f)]
+        except (OSError, ValueError):
+            return []
+
+    def _write_marker(self, prompt_version: str = None):
+        # Only invalidations younger than the memory TTL can still match an entry
+        now = time.time()
+        entries = [item for item in self._read_marker() if item[0] > now - self.ttl]
+        entries.append((now, prompt_version))
+        tmp_path = f"{self.marker_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.marker_path)
+
+    # --- disk tier -----------------------------------------------------------
+
+    def _disk_get(self, key: str):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, prompt_version, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[2] + self.disk_ttl < time.time():
+            return None
+        return row
+
+    def _disk_put(self, key: str, value: str, prompt_version: str = None):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, prompt_version, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, prompt_version, time.time()),
+            )
+            self._db.commit()
+            self._disk_writes += 1
+        if self._disk_writes % DISK_PRUNE_EVERY == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        """Deletes expired rows, then the oldest ones until the file fits disk_max_bytes."""
+        with self._db_lock:
+            expired = self._db.execute(
+                "DELETE FROM entries WHERE created_at < ?", (time.time() - self.disk_ttl,)
+            ).rowcount
+            evicted = self._db.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(LENGTH(CAST(value AS BLOB))) OVER (ORDER BY created_at DESC) AS total"
+                "  FROM entries)"
+                " WHERE total > ?)",
+                (self.disk_max_bytes,),
+            ).rowcount
+            self._db.commit()
+        if expired or evicted:
+            logger.info(f"Analysis cache pruned: {expired} expired, {evicted} evicted for size")
+
+    def _disk_invalidate(self, prompt_version: str = None) -> int:
+        with self._db_lock:
+            if prompt_version is None:
+                cursor = self._db.execute("DELETE FROM entries")
+            else:
+                cursor = self._db.execute("DELETE FROM entries WHERE prompt_version = ?", (prompt_version,))
+            self._db.commit()
+            return cursor.rowcount
+
+    def _disk_count(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    # --- public API ----------------------------------------------------------
+
+    async def get(self, key: str):
+        value = self._memory_get(key)
+        if value is not None:
+            self._count(key, "memory_hits")
+            return value
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None:
+                self._count(key, "disk_hits")
+                # keeps the row's age, so a later invalidation still matches it
+                self._memory_put(key, *row)
+                return row[0]
+
+        self._count(key, "misses")
+        return None
+
+    async def set(self, key: str, value: str, prompt_version: str = None):
+        self._memory_put(key, value, prompt_version)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, value, prompt_version)
+
+    async def invalidate(self, prompt_version: str = None) -> int:
+        """Drops every entry, or only the analyses made with `prompt_version`, in all workers."""
+        keys = [
+            key for key, entry in self._memory.items()
+            if prompt_version is None or entry[2] == prompt_version
+        ]
+        for key in keys:
+            self._memory_drop(key)
+        removed = len(keys)
+        if self.marker_path is not None:
+            await asyncio.to_thread(self._write_marker, prompt_version)
+        if self._db is not None:
+            removed = await asyncio.to_thread(self._disk_invalidate, prompt_version)
+        self._stats["invalidations"] += removed
+        return removed
+
+    async def stats(self) -> dict:
+        stats = {name: dict(value) if isinstance(value, dict) else value for name, value in self._stats.items()}
+        stats["memory_entries"] = len(self._memory)
+        stats["memory_bytes"] = self._memory_bytes
+        if self._db is not None:
+            stats["disk_entries"] = await asyncio.to_thread(self._disk_count)
+        return stats
@@ -0,0 +1,265 @@
+"""
+Shared async client for Gemini.
+
+All generation requests go through one GeminiClient, which caps the number of
+in-flight calls, enforces a deadline per request, retries transient errors
+with jittered exponential backoff and opens a circuit breaker when the
+provider keeps failing.
+"""
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+from metrics import record_usage
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+
+
+class GeminiUnavailable(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Gemini is temporarily unavailable")
+        self.retry_after = retry_after
+
+
+class GeminiTimeout(Exception):
+    """Raised when a request does not complete before its deadline."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "Gemini"):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> int:
+        if self._opened_at is None:
+            return 0
+        return max(1, int(self.reset_timeout - (time.monotonic() - self._opened_at)))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # half open: let a single probe through, everyone else keeps failing fast
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        self._probing = False
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._probing:
+                logger.warning(f"{self.name} circuit breaker opened after {self._failures} failures")
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+
+class GeminiClient:
+    def __init__(self, model_name: str, max_concurrency: int = 8, timeout: float = 60,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8,
+                 breaker_threshold: int = 5, breaker_reset: float = 30, requests_per_minute: float = 0,
+                 use_async: bool = True):
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.use_async = use_async
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._model = genai.GenerativeModel(model_name=model_name)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Blocking REST calls get their own threads instead of the loop's small
+        # default pool; a call abandoned at its deadline holds its thread until
+        # the HTTP request returns, hence the headroom.
+        self._executor = None if use_async else ThreadPoolExecutor(2 * max_concurrency, "gemini-rest")
+        # Spacing between requests so batch jobs stay under the provider's quota
+        self._interval = 60 / requests_per_minute if requests_per_minute else 0
+        self._next_slot = 0
+        self._throttle_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, model_name: str) -> "GeminiClient":
+        return cls(
+            model_name=model_name,
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+            timeout=float(os.getenv("GEMINI_TIMEOUT", "60")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+            breaker_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+            breaker_reset=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+            requests_per_minute=float(os.getenv("GEMINI_RPM", "0")),
+            # The async API only speaks gRPC; a custom (stub) endpoint goes over REST
+            use_async=not os.getenv("GEMINI_API_ENDPOINT"),
+        )
+
+    async def _call(self, prompt: str, timeout: float, stream: bool):
+        # retry=None: the SDK's default retry would repeat our own retries inside each attempt
+        options = {"timeout": timeout, "retry": None}
+        if self.use_async:
+            return await self._model.generate_content_async(prompt, stream=stream, request_options=options)
+        return await self._in_thread(self._model.generate_content, prompt, stream=stream, request_options=options)
+
+    def _in_thread(self, fn, *args, **kwargs):
+        return asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def _chunks(self, response):
+        if self.use_async:
+            async for chunk in response:
+                yield chunk
+            return
+        # the REST stream is a blocking iterator, pull each chunk in a thread
+        chunks = iter(response)
+        while (chunk := await self._in_thread(next, chunks, None)) is not None:
+            yield chunk
+
+    async def _throttle(self):
+        if not self._interval:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._throttle_lock:
+            delay = self._next_slot - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = loop.time() + self._interval
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _request(self, prompt: str, stream: bool, deadline: float):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise GeminiTimeout(f"No response from Gemini within {self.timeout}s")
+            try:
+                await asyncio.wait_for(self._throttle(), remaining)
+                remaining = deadline - loop.time()
+                return await asyncio.wait_for(self._call(prompt, remaining, stream), remaining)
+            except asyncio.TimeoutError:
+                raise GeminiTimeout(f"No response from Gemini within {self.timeout}s")
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(self._backoff(attempt), max(0, deadline - loop.time()))
+                attempt += 1
+                logger.warning(f"Gemini error ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str) -> str:
+        """Returns the response text; raises GeminiUnavailable or GeminiTimeout."""
+        if not self.breaker.allow():
+            raise GeminiUnavailable(self.breaker.retry_after())
+
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        try:
+            async with self._semaphore:
+                response = await self._request(prompt, False, deadline)
+        except (GeminiTimeout, *RETRYABLE_ERRORS):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Client errors (bad request, safety block, cancellation) say nothing
+            # about provider health; just release a half-open probe.
+            self.breaker.release()
+            raise
+
+        self.breaker.record_success()
+        record_usage(getattr(response, "usage_metadata", None))
+        return response.text
+
+    async def stream(self, prompt: str):
+        """
+        Yields response text chunks as they arrive. Only the initial request is
+        retried; once output has started a failure is raised to the caller.
+
+        The provider stream is read by its own task into a queue, so the time
+        the caller spends between chunks (a slow SSE client) neither counts
+        against the deadline nor holds a concurrency slot.
+        """
+        queue = asyncio.Queue()
+        reader = asyncio.create_task(self._read_stream(prompt, queue))
+        try:
+            while (text := await queue.get()) is not None:
+                yield text
+            await reader
+        finally:
+            if not reader.done():
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+
+    async def _read_stream(self, prompt: str, queue: asyncio.Queue):
+        """Puts response text chunks on `queue`, then None, also when it fails."""
+        try:
+            # checked here, not in stream(): a task cancelled before it starts never releases a probe
+            if not self.breaker.allow():
+                raise GeminiUnavailable(self.breaker.retry_after())
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            try:
+                async with self._semaphore:
+                    response = await self._request(prompt, True, deadline)
+                    chunks = self._chunks(response)
+                    usage = None
+                    while True:
+                        remaining = deadline - loop.time()
+                        try:
+                            chunk = await asyncio.wait_for(anext(chunks, None), max(remaining, 0))
+                        except asyncio.TimeoutError:
+                            raise GeminiTimeout(f"Gemini response not finished within {self.timeout}s")
+                        if chunk is None:
+                            break
+                        # usage totals arrive with the last chunk
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        if chunk.text:
+                            queue.put_nowait(chunk.text)
+            except (GeminiTimeout, *RETRYABLE_ERRORS):
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                self.breaker.release()
+                raise
+
+            self.breaker.record_success()
+            record_usage(usage)
+        finally:
+            queue.put_nowait(None)
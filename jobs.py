@@ -0,0 +1,410 @@
+"""
+Batch analysis jobs.
+
+POST /jobs stores each uploaded PDF on disk and puts a job on an in-process
+asyncio queue drained by a fixed number of worker tasks. Job state lives in a
+JobStore: in memory by default, or in SQLite (JOBS_DB_PATH) so that queued
+jobs survive a restart and any uvicorn worker can answer GET /jobs/{id}.
+
+Every queued or running job is owned by one JobQueue, which refreshes a
+heartbeat on its rows. Each queue periodically adopts jobs whose owner
+stopped heartbeating (a crashed or restarted uvicorn worker) or that were
+released on shutdown, with a conditional update so only one queue gets each
+job, and claims a job the same way before running it.
+"""
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when the batch queue cannot take more jobs."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Batch job queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    __slots__ = ("id", "filename", "path", "status", "result", "error",
+                 "webhook_url", "created_at", "finished_at", "owner", "heartbeat_at")
+
+    def __init__(self, filename: str, path: str, webhook_url: str = None, id: str = None,
+                 status: str = QUEUED, result: str = None, error: str = None,
+                 created_at: float = None, finished_at: float = None,
+                 owner: str = None, heartbeat_at: float = None):
+        self.id = id or uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.status = status
+        self.result = result
+        self.error = error
+        self.webhook_url = webhook_url
+        self.created_at = created_at or time.time()
+        self.finished_at = finished_at
+        self.owner = owner
+        self.heartbeat_at = heartbeat_at
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "analysis": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class MemoryJobStore:
+    def __init__(self, max_finished: int = 1000):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+
+    async def save(self, job: Job):
+        self._jobs[job.id] = job
+        finished = [j.id for j in self._jobs.values() if j.status in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    async def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    async def claim(self, job: Job, owner: str) -> bool:
+        # one event loop per store, so checking and setting cannot interleave
+        if job.status != QUEUED or job.owner != owner:
+            return False
+        job.status, job.heartbeat_at = RUNNING, time.time()
+        return True
+
+    # A memory store belongs to a single process: there is nobody to recover from
+
+    async def heartbeat(self, owner: str):
+        pass
+
+    async def release(self, owner: str):
+        pass
+
+    async def recoverable(self, stale_before: float) -> list:
+        return []
+
+    async def adopt(self, job: Job, owner: str, stale_before: float) -> bool:
+        return False
+
+    async def fail_lost(self, job: Job, stale_before: float) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, filename TEXT, path TEXT, status TEXT, result TEXT, error TEXT,"
+            " webhook_url TEXT, created_at REAL, finished_at REAL, owner TEXT, heartbeat_at REAL)"
+        )
+        # databases created before claims existed lack the last two columns
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._db.commit()
+        logger.info(f"Batch jobs persisted to {path}")
+
+    def _save(self, job: Job):
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(Job.__slots__)}) "
+                f"VALUES ({', '.join('?' for _ in Job.__slots__)})",
+                tuple(getattr(job, field) for field in Job.__slots__),
+            )
+            self._db.commit()
+
+    def _update(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            rowcount = self._db.execute(sql, params).rowcount
+            self._db.commit()
+        return rowcount
+
+    def _select(self, where: str, params: tuple) -> list:
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(Job.__slots__)} FROM jobs WHERE {where}", params).fetchall()
+        return [Job(**dict(zip(Job.__slots__, row))) for row in rows]
+
+    async def save(self, job: Job):
+        await asyncio.to_thread(self._save, job)
+
+    async def get(self, job_id: str):
+        jobs = await asyncio.to_thread(self._select, "id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    async def claim(self, job: Job, owner: str) -> bool:
+        """Marks a job queued by `owner` running; False if another worker adopted it meanwhile."""
+        now = time.time()
+        claimed = await asyncio.to_thread(
+            self._update,
+            "UPDATE jobs SET status = ?, heartbeat_at = ? WHERE id = ? AND status = ? AND owner = ?",
+            (RUNNING, now, job.id, QUEUED, owner),
+        )
+        if claimed:
+            job.status, job.heartbeat_at = RUNNING, now
+        return bool(claimed)
+
+    async def heartbeat(self, owner: str):
+        await asyncio.to_thread(
+            self._update,
+            "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+            (time.time(), owner, QUEUED, RUNNING),
+        )
+
+    async def release(self, owner: str):
+        """Hands the jobs still waiting in `owner`'s queue to the other workers."""
+        await asyncio.to_thread(
+            self._update, "UPDATE jobs SET owner = NULL WHERE owner = ? AND status = ?", (owner, QUEUED)
+        )
+
+    # queued or running under an owner that stopped heartbeating, or released
+    _ORPHANED = "((status IN (?, ?) AND COALESCE(heartbeat_at, 0) < ?) OR (status = ? AND owner IS NULL))"
+
+    def _orphaned_params(self, stale_before: float) -> tuple:
+        return QUEUED, RUNNING, stale_before, QUEUED
+
+    async def recoverable(self, stale_before: float) -> list:
+        return await asyncio.to_thread(
+            self._select, f"{self._ORPHANED} ORDER BY created_at", self._orphaned_params(stale_before)
+        )
+
+    async def adopt(self, job: Job, owner: str, stale_before: float) -> bool:
+        """Requeues an orphaned job under `owner`; False if another worker got it first."""
+        now = time.time()
+        adopted = await asyncio.to_thread(
+            self._update,
+            f"UPDATE jobs SET status = ?, owner = ?, heartbeat_at = ? WHERE id = ? AND {self._ORPHANED}",
+            (QUEUED, owner, now, job.id) + self._orphaned_params(stale_before),
+        )
+        if adopted:
+            job.status, job.owner, job.heartbeat_at = QUEUED, owner, now
+        return bool(adopted)
+
+    async def fail_lost(self, job: Job, stale_before: float) -> bool:
+        """Fails an orphaned job whose file is gone, unless it was adopted or finished meanwhile."""
+        job.error, job.finished_at = "Job lost during restart", time.time()
+        return bool(await asyncio.to_thread(
+            self._update,
+            f"UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND {self._ORPHANED}",
+            (FAILED, job.error, job.finished_at, job.id) + self._orphaned_params(stale_before),
+        ))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def check_webhook_url(url: str, allowed_hosts: frozenset = frozenset()):
+    """
+    Raises ValueError unless `url` is http(s) and its host is in
+    `allowed_hosts`, or, without an allowlist, resolves to public addresses
+    only: the service must not be usable to POST into its own network.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("webhook_url must be an http(s) URL")
+    host = parsed.hostname.lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise ValueError(f"webhook_url host {host} is not allowed")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or 80, type=socket.SOCK_STREAM)}
+    except socket.gaierror:
+        raise ValueError(f"webhook_url host {host} does not resolve") from None
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"webhook_url host {host} resolves to a non-public address")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        # a redirect would skip check_webhook_url; the 3xx is reported as an error instead
+        return None
+
+
+_webhook_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def _post_webhook(url: str, payload: dict, allowed_hosts: frozenset = frozenset()):
+    # checked again at send time: the host may resolve differently than at submit
+    check_webhook_url(url, allowed_hosts)
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with _webhook_opener.open(request, timeout=10) as response:
+        return response.status
+
+
+class JobQueue:
+    """
+    `handler(job)` is awaited for every job and returns the analysis text;
+    any exception marks the job failed with the exception's `detail` or message.
+    """
+
+    def __init__(self, store, handler, workers: int = 4, max_queued: int = 1000,
+                 retry_after: int = 10, jobs_dir: str = "jobs", stale_after: float = 60,
+                 webhook_hosts: frozenset = frozenset()):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.retry_after = retry_after
+        self.jobs_dir = jobs_dir
+        self.stale_after = stale_after
+        self.webhook_hosts = webhook_hosts
+        # identifies this process's claims in a shared store
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        # slots promised to submit() calls still saving their jobs
+        self._reserved = 0
+        self._tasks = []
+
+    @classmethod
+    def from_env(cls, handler) -> "JobQueue":
+        db_path = os.getenv("JOBS_DB_PATH")
+        store = SQLiteJobStore(db_path) if db_path else MemoryJobStore()
+        return cls(
+            store,
+            handler,
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            max_queued=int(os.getenv("JOB_QUEUE_SIZE", "1000")),
+            jobs_dir=os.getenv("JOBS_DIR", "jobs"),
+            stale_after=float(os.getenv("JOB_STALE_AFTER", "60")),
+            webhook_hosts=frozenset(
+                host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+            ),
+        )
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def free_slots(self) -> int:
+        return self._queue.maxsize - self._queue.qsize() - self._reserved
+
+    async def start(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.store.release(self.owner)
+        self.store.close()
+
+    async def submit(self, jobs: list):
+        """Queues all of `jobs` or, if they do not fit, none of them."""
+        if len(jobs) > self.free_slots():
+            raise JobQueueFull(self.retry_after)
+        self._reserved += len(jobs)
+        try:
+            for job in jobs:
+                job.owner, job.heartbeat_at = self.owner, time.time()
+                await self.store.save(job)
+        finally:
+            self._reserved -= len(jobs)
+        for job in jobs:
+            self._queue.put_nowait(job)
+
+    async def get(self, job_id: str):
+        return await self.store.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _recover(self):
+        """Adopts orphaned jobs while the queue has room; the rest wait for the next round."""
+        stale_before = time.time() - self.stale_after
+        recovered = 0
+        for job in await self.store.recoverable(stale_before):
+            if self.free_slots() <= 0:
+                break
+            if not os.path.exists(job.path):
+                await self.store.fail_lost(job, stale_before)
+            elif await self.store.adopt(job, self.owner, stale_before):
+                self._queue.put_nowait(job)
+                recovered += 1
+        if recovered:
+            logger.info(f"Requeued {recovered} unfinished batch jobs")
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            try:
+                await self.store.heartbeat(self.owner)
+                await self._recover()
+            except Exception as e:
+                logger.warning(f"Batch job heartbeat failed: {e}")
+
+    async def _run(self, job: Job):
+        if not await self.store.claim(job, self.owner):
+            # adopted by another worker while this one was stalled
+            return
+        try:
+            job.result = await self.handler(job)
+            job.status = DONE
+        except asyncio.CancelledError:
+            # shutting down: release the job so another worker, or the next start, runs it
+            job.status, job.owner = QUEUED, None
+            await asyncio.shield(self.store.save(job))
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(getattr(e, "detail", None) or e)
+            logger.warning(f"[{job.id}] Batch job failed: {job.error}")
+
+        job.finished_at = time.time()
+        await self.store.save(job)
+        try:
+            os.unlink(job.path)
+        except FileNotFoundError:
+            pass
+
+        if job.webhook_url:
+            try:
+                await asyncio.to_thread(_post_webhook, job.webhook_url, job.to_dict(), self.webhook_hosts)
+            except Exception as e:
+                logger.warning(f"[{job.id}] Webhook {job.webhook_url} failed: {e}")
@@ -0,0 +1,300 @@
+"""
+Compact, structured prompts for lab reports.
+
+Instead of sending every page's raw text, analyte rows (name, value, unit,
+reference range) are parsed out of the extracted text, headers and footers
+repeated on most pages are kept only once, units are normalised and the results are
+rendered one per line with out-of-range values flagged. Lines that are not
+results (patient data, comments, conclusions) are kept in document order with
+whitespace collapsed.
+"""
+import re
+from collections import Counter
+
+# Bump when the rendered format changes so cached analyses are not reused
+FORMAT_VERSION = "3"
+
+CELL_SEPARATOR = "\t"
+
+_SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹", "0123456789")
+
+_NUMBER = r"\d+(?:[.,]\d+)?"
+_UNIT = r"(?:[x×*]?\s?10(?:\^|\*\*?)?\d+\s?/\s?\S+|%|[^\W\d_][^\s]*)"
+_RANGE = (
+    rf"[(\[]?\s*(?:(?P<low>{_NUMBER})\s*[-–—]\s*(?P<high>{_NUMBER})"
+    rf"|(?P<op>[<>≤≥]=?)\s*(?P<limit>{_NUMBER}))\s*[)\]]?"
+)
+_ROW_RE = re.compile(
+    rf"^(?P<name>[^<>]*?[^\W\d_][^<>]*?)[\s:]+"
+    rf"(?P<value>[<>]?\s?{_NUMBER})\s*"
+    rf"(?P<flag>[↑↓*!]|[HL](?=\s))?\s*"
+    rf"(?P<unit>{_UNIT})?\s*"
+    rf"(?:{_RANGE})?\s*"
+    rf"(?P<trailing_flag>[↑↓*!HL])?\s*$"
+)
+_RANGE_RE = re.compile(rf"^{_RANGE}$")
+_UNIT_RE = re.compile(rf"^{_UNIT}$")
+# Page numbers are the only part of a header or footer allowed to differ between pages
+_PAGE_NUMBER_RE = re.compile(
+    r"\b(?:стр(?:аница)?|лист|page)\.?\s*\d+(?:\s*(?:из|of|/)\s*\d+)?"
+    r"|^[-–—\s]*\d+(?:\s*(?:из|of|/)\s*\d+)?[-–—\s]*$"
+)
+_SPACES_RE = re.compile(r"\s+")
+_MEASUREMENT_RE = re.compile(rf"{_NUMBER}\s*(\S+)")
+
+# Spelling variants mapped to one canonical form (lookup is lower-cased)
+UNIT_ALIASES = {
+    "г/л": "g/L", "g/l": "g/L",
+    "мг/л": "mg/L", "mg/l": "mg/L",
+    "ммоль/л": "mmol/L", "mmol/l": "mmol/L",
+    "мкмоль/л": "µmol/L", "мкмоль/л.": "µmol/L", "umol/l": "µmol/L", "µmol/l": "µmol/L", "μmol/l": "µmol/L",
+    "ед/л": "U/L", "u/l": "U/L", "iu/l": "U/L", "ме/л": "U/L",
+    "мме/л": "mIU/L", "miu/l": "mIU/L", "мкме/мл": "µIU/mL", "uiu/ml": "µIU/mL", "µiu/ml": "µIU/mL",
+    "фл": "fL", "fl": "fL", "пг": "pg", "pg": "pg",
+    "мм/ч": "mm/h", "mm/h": "mm/h", "mm/hr": "mm/h",
+    "%": "%",
+}
+
+# Units without a "/" that are still accepted after a value (lookup is lower-cased)
+BARE_UNITS = {"%", "fl", "фл", "pg", "пг", "sec", "сек", "s", "ед", "ед.", "u", "iu", "ме"}
+
+# Unit conversions that do not depend on the analyte: unit -> (unit, factor)
+UNIT_CONVERSIONS = {
+    "g/dL": ("g/L", 10),
+    "mg/dL": ("mg/L", 10),
+}
+
+
+class LabResult:
+    __slots__ = ("name", "value", "unit", "low", "high", "flag")
+
+    def __init__(self, name: str, value: str, unit: str = "", low: float = None,
+                 high: float = None, flag: str = ""):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.low = low
+        self.high = high
+        self.flag = flag
+
+    @property
+    def reference(self) -> str:
+        if self.low is not None and self.high is not None:
+            return f"{_fmt(self.low)}-{_fmt(self.high)}"
+        if self.high is not None:
+            return f"<{_fmt(self.high)}"
+        if self.low is not None:
+            return f">{_fmt(self.low)}"
+        return ""
+
+
+def _number(text: str) -> float:
+    return float(text.replace(",", ".").lstrip("<>").strip())
+
+
+def _fmt(number: float) -> str:
+    return f"{number:g}"
+
+
+def normalize_unit(unit: str) -> str:
+    unit = unit.translate(_SUPERSCRIPTS).replace(" ", "").replace("×", "x")
+    lowered = unit.lower()
+    if lowered in UNIT_ALIASES:
+        return UNIT_ALIASES[lowered]
+    match = re.match(r"^[x*]?10(?:\^|\*\*?)?(\d+)/(\S+)$", lowered)
+    if match:
+        per = {"л": "L", "l": "L", "мкл": "µL", "ul": "µL", "µl": "µL"}.get(match.group(2), match.group(2))
+        return f"10^{match.group(1)}/{per}"
+    if lowered.endswith("/dl"):
+        return unit[:-3] + "/dL"
+    return unit
+
+
+def is_unit(text: str) -> bool:
+    """
+    True for a known unit or anything per volume/time ("ng/mL", "10^9/L");
+    a word such as "fasting" or "отрицательно" after a number is not a unit.
+    """
+    lowered = text.translate(_SUPERSCRIPTS).lower()
+    return lowered in UNIT_ALIASES or lowered in BARE_UNITS or "/" in lowered
+
+
+def _has_measurement(name: str) -> bool:
+    # "Calcium 2.1 mmol/L 2.2" - a row whose note after the range shifted the match
+    return any(is_unit(match.group(1)) for match in _MEASUREMENT_RE.finditer(name))
+
+
+def _out_of_range(result: LabResult, reported_flag: str) -> str:
+    try:
+        value = _number(result.value)
+    except ValueError:
+        return ""
+    if result.high is not None and value > result.high:
+        return "H"
+    if result.low is not None and value < result.low:
+        return "L"
+    if result.low is None and result.high is None:
+        return {"↑": "H", "H": "H", "↓": "L", "L": "L", "*": "!", "!": "!"}.get(reported_flag, "")
+    return ""
+
+
+def _make_result(name: str, value: str, unit: str, range_match, reported_flag: str = ""):
+    name = _SPACES_RE.sub(" ", name).strip(" .:-")
+    if not name or len(name) > 60:
+        return None
+
+    low = high = None
+    if range_match is not None:
+        if range_match.group("low") is not None:
+            low, high = _number(range_match.group("low")), _number(range_match.group("high"))
+        elif range_match.group("limit") is not None:
+            limit = _number(range_match.group("limit"))
+            if range_match.group("op")[0] in "<≤":
+                high = limit
+            else:
+                low = limit
+
+    value = value.replace(" ", "").replace(",", ".")
+    unit = normalize_unit(unit) if unit else ""
+    if unit in UNIT_CONVERSIONS:
+        unit, factor = UNIT_CONVERSIONS[unit]
+        prefix = value[0] if value[0] in "<>" else ""
+        value = prefix + _fmt(_number(value) * factor)
+        low = low * factor if low is not None else None
+        high = high * factor if high is not None else None
+
+    result = LabResult(name, value, unit, low, high)
+    result.flag = _out_of_range(result, reported_flag)
+    return result
+
+
+def _parse_cells(cells: list):
+    """Parses a table row: first cell is the name, then value, unit and range in any order."""
+    cells = [_SPACES_RE.sub(" ", cell).strip() for cell in cells]
+    cells = [cell for cell in cells if cell]
+    if len(cells) < 2:
+        return None
+
+    name, value, unit, range_match, flag = cells[0], None, "", None, ""
+    for cell in cells[1:]:
+        if value is None and re.fullmatch(rf"[<>]?\s?{_NUMBER}", cell):
+            value = cell
+        elif value is None and re.fullmatch(rf"[<>]?\s?{_NUMBER}\s*[↑↓HL*!]", cell):
+            value, flag = cell[:-1].strip(), cell[-1]
+        elif range_match is None and _RANGE_RE.match(cell):
+            range_match = _RANGE_RE.match(cell)
+        elif cell in ("↑", "↓", "H", "L", "*", "!"):
+            flag = cell
+        elif not unit and _UNIT_RE.match(cell.translate(_SUPERSCRIPTS)) and is_unit(cell):
+            unit = cell.translate(_SUPERSCRIPTS)
+    if value is None or not (unit or range_match):
+        return None
+    return _make_result(name, value, unit, range_match, flag)
+
+
+def parse_result(line: str):
+    """Returns a LabResult for an analyte row, or None for any other line."""
+    if CELL_SEPARATOR in line:
+        return _parse_cells(line.split(CELL_SEPARATOR))
+
+    match = _ROW_RE.match(_SPACES_RE.sub(" ", line.translate(_SUPERSCRIPTS)).strip())
+    if match is None or not (match.group("unit") or match.group("low") or match.group("limit")):
+        return None
+    # Anything the pattern only fits by shifting words around stays a note, verbatim
+    if (match.group("unit") and not is_unit(match.group("unit"))) or _has_measurement(match.group("name")):
+        return None
+    range_match = match if (match.group("low") or match.group("limit")) else None
+    flag = match.group("flag") or match.group("trailing_flag") or ""
+    return _make_result(match.group("name"), match.group("value"), match.group("unit") or "", range_match, flag)
+
+
+def repeated_lines(pages: list) -> set:
+    """
+    Shapes of lines found on most pages (headers, footers, lab address).
+    Only page numbers are masked when comparing, so "Page 1 of 3" and
+    "Page 2 of 3" match but lines differing in a date or a value do not.
+    """
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for text in pages:
+        counts.update({_line_shape(line) for line in text.splitlines() if line.strip()})
+    threshold = len(pages) // 2 + 1
+    return {shape for shape, count in counts.items() if count >= threshold}
+
+
+def _line_shape(line: str) -> str:
+    return _PAGE_NUMBER_RE.sub("#", _SPACES_RE.sub(" ", line).strip().lower())
+
+
+def render_result(result: LabResult) -> str:
+    """
+    "Glucose 5.1 mmol/L" for values within range; values outside it also get
+    the flag and the reference range: "Urea 8.09 mmol/L H 2.8-7.2".
+    """
+    parts = [result.name, result.value]
+    if result.unit:
+        parts.append(result.unit)
+    if result.flag:
+        parts.append(result.flag)
+        if result.reference:
+            parts.append(result.reference)
+    return " ".join(parts)
+
+
+def compact_text(pages: list):
+    """
+    Returns (text, result_count) for the prompt. Falls back to the plain page
+    text with repeated headers/footers removed when no results are found.
+
+    A header or footer is kept once: it often carries the patient's sex and
+    date of birth, which matter for reading the results. Every other line is
+    kept, repeated or not.
+    """
+    boilerplate = repeated_lines(pages)
+    lines, seen_boilerplate = [], set()
+    result_count = out_of_range = 0
+
+    for text in pages:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            result = parse_result(line)
+            if result is not None:
+                result_count += 1
+                out_of_range += bool(result.flag)
+                lines.append(render_result(result))
+                continue
+            note = _SPACES_RE.sub(" ", line.replace(CELL_SEPARATOR, " ")).strip()
+            shape = _line_shape(note)
+            if shape in boilerplate:
+                if shape in seen_boilerplate:
+                    continue
+                seen_boilerplate.add(shape)
+            lines.append(note)
+
+    if result_count:
+        lines.insert(0, f"[показатель значение ед.; вне нормы ({out_of_range} из {result_count}) "
+                        f"также H/L выше/ниже нормы или ! отметка лаборатории и референс]")
+    return "".join(line + "\n" for line in lines), result_count
+
+
+def page_text_with_tables(page) -> str:
+    """
+    Worker-side extraction for the compact format: ruled tables found by
+    pdfplumber come back one row per line with cells separated by
+    CELL_SEPARATOR, the rest of the page as text lines, in reading order.
+    """
+    tables = page.find_tables()
+    if not tables:
+        return page.extract_text() or ""
+
+    rest = page
+    for table in tables:
+        rest = rest.outside_bbox(table.bbox)
+    blocks = [(line["top"], line["text"]) for line in rest.extract_text_lines()]
+    for table in tables:
+        rows = (CELL_SEPARATOR.join(cell or "" for cell in row) for row in table.extract())
+        blocks.append((table.bbox[1], "\n".join(rows)))
+    blocks.sort(key=lambda block: block[0])
+    return "\n".join(text for _, text in blocks if text)
@@ -0,0 +1,425 @@
+"""
+LLM backends and the router in front of them.
+
+LLM_BACKENDS lists the providers to use, in order of preference: "gemini",
+"openai" and "stub" (a local fake for tests and load runs). LLMRouter keeps
+rolling p50/p95 latency and error rate for each backend and sends each request
+to the fastest healthy one, falling over to the next one on transient errors
+(timeouts, rate limits, 5xx, an open breaker); any other error, such as a
+rejected or safety-blocked prompt, goes straight to the caller. With
+LLM_HEDGE=1, a request that runs longer than its backend's p95 is sent again
+(to the next backend, or to the same one when there is only one). The first
+answer wins and the other call is cancelled.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from gemini_client import RETRYABLE_ERRORS, CircuitBreaker, GeminiClient, GeminiTimeout, GeminiUnavailable
+from metrics import LLM_HEDGES, LLM_REQUESTS, record_usage
+
+logger = logging.getLogger(__name__)
+
+
+class BackendUnavailable(Exception):
+    """Raised without calling a provider while its circuit breaker is open."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("LLM backends are temporarily unavailable")
+        self.retry_after = retry_after
+
+
+class BackendTimeout(Exception):
+    """Raised when a provider does not answer before its deadline."""
+
+
+class LLMBackend:
+    """`generate(prompt)` returns the whole answer, `stream(prompt)` yields it in chunks."""
+
+    name = None
+    model_name = None
+    # errors worth retrying on another backend; the rest would fail there too
+    transient_errors = (BackendUnavailable, BackendTimeout)
+
+    @property
+    def state(self) -> str:
+        return "closed"
+
+    def retry_after(self) -> int:
+        return 0
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str):
+        raise NotImplementedError
+        yield
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    transient_errors = LLMBackend.transient_errors + (GeminiUnavailable, GeminiTimeout, *RETRYABLE_ERRORS)
+
+    def __init__(self, client: GeminiClient):
+        self.client = client
+        self.model_name = client.model_name
+
+    @property
+    def state(self) -> str:
+        return self.client.breaker.state
+
+    def retry_after(self) -> int:
+        return self.client.breaker.retry_after()
+
+    async def generate(self, prompt: str) -> str:
+        return await self.client.generate(prompt)
+
+    async def stream(self, prompt: str):
+        async for text in self.client.stream(prompt):
+            yield text
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, model_name: str = "gpt-3.5-turbo", max_concurrency: int = 8, timeout: float = 60,
+                 max_retries: int = 2, breaker_threshold: int = 5, breaker_reset: float = 30,
+                 base_url: str = None):
+        try:
+            import openai
+        except ImportError:
+            raise RuntimeError("LLM_BACKENDS includes openai, but the openai package is not installed") from None
+        self.model_name = model_name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset, name="OpenAI")
+        # The SDK retries rate limits and 5xx itself, with backoff; the API key comes from OPENAI_API_KEY
+        self._client = openai.AsyncOpenAI(base_url=base_url, timeout=timeout, max_retries=max_retries)
+        # APITimeoutError is an APIConnectionError, so it is checked first in _guarded
+        self._timeout_error = openai.APITimeoutError
+        self._provider_errors = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+        self.transient_errors = LLMBackend.transient_errors + self._provider_errors
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_env(cls) -> "OpenAIBackend":
+        return cls(
+            model_name=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            timeout=float(os.getenv("OPENAI_TIMEOUT", "60")),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+            breaker_threshold=int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5")),
+            breaker_reset=float(os.getenv("OPENAI_BREAKER_RESET", "30")),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+        )
+
+    @property
+    def state(self) -> str:
+        return self.breaker.state
+
+    def retry_after(self) -> int:
+        return self.breaker.retry_after()
+
+    def _create(self, prompt: str, stream: bool):
+        options = {"stream_options": {"include_usage": True}} if stream else {}
+        return self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=stream,
+            **options,
+        )
+
+    @asynccontextmanager
+    async def _guarded(self):
+        if not self.breaker.allow():
+            raise BackendUnavailable(self.breaker.retry_after())
+        try:
+            async with self._semaphore:
+                yield
+        except self._timeout_error as e:
+            self.breaker.record_failure()
+            raise BackendTimeout(f"No response from OpenAI within {self.timeout}s") from e
+        except self._provider_errors:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Same as GeminiClient: client errors and cancellation only release a half-open probe
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+
+    async def generate(self, prompt: str) -> str:
+        async with self._guarded():
+            response = await self._create(prompt, stream=False)
+        record_usage(response.usage)
+        return response.choices[0].message.content or ""
+
+    async def stream(self, prompt: str):
+        usage = None
+        async with self._guarded():
+            async for chunk in await self._create(prompt, stream=True):
+                # with include_usage the last chunk has no choices, only usage totals
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        record_usage(usage)
+
+
+class StubBackend(LLMBackend):
+    """Answers locally after STUB_LATENCY seconds, failing STUB_ERROR_RATE of the calls."""
+
+    name = "stub"
+    model_name = "stub"
+
+    def __init__(self, latency: float = 0, error_rate: float = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    @classmethod
+    def from_env(cls) -> "StubBackend":
+        return cls(
+            latency=float(os.getenv("STUB_LATENCY", "0")),
+            error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+        )
+
+    async def _wait(self):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise BackendUnavailable(retry_after=1)
+
+    def _answer(self, prompt: str) -> str:
+        return f"[stub] Получен запрос из {len(prompt)} символов."
+
+    async def generate(self, prompt: str) -> str:
+        await self._wait()
+        return self._answer(prompt)
+
+    async def stream(self, prompt: str):
+        await self._wait()
+        for word in self._answer(prompt).split(" "):
+            yield word + " "
+
+
+class LatencyWindow:
+    """Latency of the last `size` calls younger than `max_age` seconds; errors are kept as None."""
+
+    def __init__(self, size: int = 200, max_age: float = 300):
+        self.max_age = max_age
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float = None):
+        self._samples.append((time.monotonic(), seconds))
+
+    def _recent(self) -> deque:
+        # Old samples expire, so a backend that failed a while ago gets traffic again
+        cutoff = time.monotonic() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return self._samples
+
+    def latencies(self) -> list:
+        return sorted(seconds for _, seconds in self._recent() if seconds is not None)
+
+    def percentile(self, q: float, latencies: list = None):
+        latencies = self.latencies() if latencies is None else latencies
+        if not latencies:
+            return None
+        return latencies[max(0, math.ceil(q * len(latencies)) - 1)]
+
+    def error_rate(self) -> float:
+        samples = self._recent()
+        if not samples:
+            return 0.0
+        return sum(1 for _, seconds in samples if seconds is None) / len(samples)
+
+    def summary(self) -> dict:
+        latencies = self.latencies()
+        p50, p95 = self.percentile(0.5, latencies), self.percentile(0.95, latencies)
+        return {
+            "samples": len(self._samples),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+
+def backend_from_env(name: str, gemini_model: str) -> LLMBackend:
+    if name == "gemini":
+        return GeminiBackend(GeminiClient.from_env(gemini_model))
+    if name == "openai":
+        return OpenAIBackend.from_env()
+    if name == "stub":
+        return StubBackend.from_env()
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
+class LLMRouter:
+    """
+    Picks a backend per request: ones with an open circuit breaker are skipped,
+    ones over `max_error_rate` go last, the rest are ordered by p50 latency
+    (configured order until there are samples). Streams are ranked and hedged
+    on time to the first chunk.
+    """
+
+    def __init__(self, backends: list, hedge: bool = False, hedge_min_samples: int = 20,
+                 max_error_rate: float = 0.5, window: int = 200, max_age: float = 300):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.max_error_rate = max_error_rate
+        self._stats = {
+            (backend.name, kind): LatencyWindow(window, max_age)
+            for backend in backends for kind in ("generate", "stream")
+        }
+
+    @classmethod
+    def from_env(cls, names: list, gemini_model: str) -> "LLMRouter":
+        return cls(
+            [backend_from_env(name, gemini_model) for name in names],
+            hedge=os.getenv("LLM_HEDGE") == "1",
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            max_error_rate=float(os.getenv("LLM_MAX_ERROR_RATE", "0.5")),
+            window=int(os.getenv("LLM_STATS_WINDOW", "200")),
+            max_age=float(os.getenv("LLM_STATS_MAX_AGE", "300")),
+        )
+
+    @property
+    def model_name(self) -> str:
+        """All configured models; part of the analysis cache key."""
+        return "+".join(backend.model_name for backend in self.backends)
+
+    def status(self) -> dict:
+        return {
+            backend.name: {
+                "model": backend.model_name,
+                "circuit": backend.state,
+                "generate": self._stats[backend.name, "generate"].summary(),
+                "stream": self._stats[backend.name, "stream"].summary(),
+            }
+            for backend in self.backends
+        }
+
+    def _ranked(self, kind: str) -> list:
+        available = [backend for backend in self.backends if backend.state != "open"]
+        if not available:
+            raise BackendUnavailable(min(backend.retry_after() for backend in self.backends))
+
+        def key(backend):
+            stats = self._stats[backend.name, kind]
+            return stats.error_rate() > self.max_error_rate, stats.percentile(0.5) or 0
+
+        return sorted(available, key=key)
+
+    def _hedge_delay(self, backend: LLMBackend, kind: str):
+        if not self.hedge:
+            return None
+        latencies = self._stats[backend.name, kind].latencies()
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return self._stats[backend.name, kind].percentile(0.95, latencies)
+
+    async def _timed(self, kind: str, backend: LLMBackend, call):
+        stats = self._stats[backend.name, kind]
+        started = time.monotonic()
+        try:
+            result = await call
+        except asyncio.CancelledError:
+            # a cancelled hedge loser tells nothing about its latency
+            LLM_REQUESTS.labels(backend.name, "cancelled").inc()
+            raise
+        except backend.transient_errors:
+            stats.record(None)
+            LLM_REQUESTS.labels(backend.name, "error").inc()
+            raise
+        except Exception:
+            # the request was at fault, not the backend: no effect on its ranking
+            LLM_REQUESTS.labels(backend.name, "rejected").inc()
+            raise
+        stats.record(time.monotonic() - started)
+        LLM_REQUESTS.labels(backend.name, "ok").inc()
+        return result
+
+    async def _race(self, kind: str, start, discard=None):
+        """
+        Awaits `start(backend)` on the best backend, hedging and failing over
+        as described above. `discard` is awaited on results that lost the race.
+        """
+        candidates = self._ranked(kind)
+        pending = {}
+        hedge_delay = None
+        hedge_task = None
+        error = None
+
+        def spawn(backend):
+            task = asyncio.create_task(self._timed(kind, backend, start(backend)))
+            pending[task] = backend
+            return task
+
+        try:
+            while True:
+                if not pending:
+                    if not candidates:
+                        raise error
+                    backend = candidates.pop(0)
+                    spawn(backend)
+                    hedge_delay = self._hedge_delay(backend, kind)
+
+                timeout = hedge_delay if hedge_task is None and len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    slow = next(iter(pending.values()))
+                    target = candidates.pop(0) if candidates else slow
+                    logger.info(f"{slow.name} passed its p95 ({timeout:.2f}s), hedging on {target.name}")
+                    hedge_task = spawn(target)
+                    continue
+
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if hedge_task is not None:
+                            LLM_HEDGES.labels("hedge" if task is hedge_task else "primary").inc()
+                        return task.result()
+                    error = task.exception()
+                    if not isinstance(error, backend.transient_errors):
+                        raise error
+                    logger.warning(f"LLM backend {backend.name} failed: {error!r}")
+        finally:
+            for task in pending:
+                task.cancel()
+            results = await asyncio.gather(*pending, return_exceptions=True)
+            if discard is not None:
+                for result in results:
+                    if not isinstance(result, BaseException):
+                        await discard(result)
+
+    async def generate(self, prompt: str) -> str:
+        return await self._race("generate", lambda backend: backend.generate(prompt))
+
+    async def stream(self, prompt: str):
+        """
+        Yields answer chunks. Backends race for the first chunk; after that the
+        stream is bound to the winner and a failure goes to the caller.
+        """
+
+        async def first_chunk(backend):
+            chunks = backend.stream(prompt)
+            return chunks, await anext(chunks, None)
+
+        async def close(result):
+            await result[0].aclose()
+
+        chunks, first = await self._race("stream", first_chunk, close)
+        try:
+            if first is None:
+                return
+            yield first
+            async for text in chunks:
+                yield text
+        finally:
+            await chunks.aclose()
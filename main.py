@@ -1,16 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Depends
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import pdfplumber
+from starlette.background import BackgroundTask
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-import io
+import asyncio
+import json
 import logging
+import time
 import traceback
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
 from google.generativeai import generative_models
 
+from pdf_pool import PdfPool, PoolBusy, ExtractionTimeout
+from cache import AnalysisCache, sha256_hex, text_key, analysis_key
+from gemini_client import GeminiUnavailable, GeminiTimeout
+from llm_backends import LLMRouter, BackendUnavailable, BackendTimeout
+from upload import MAX_BATCH_UPLOAD_BYTES, UploadLimitMiddleware, SpooledUpload, spool_upload
+from jobs import Job, JobQueue, JobQueueFull, check_webhook_url
+import lab_results
+import metrics
+from metrics import MetricsMiddleware, stage, UPLOAD_BYTES, PROMPT_CHARS, CACHE_LOOKUPS
+from profiling import ProfilingMiddleware, PROFILING_ENABLED
+
 # Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,21 +38,74 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 logger.info("Environment variables loaded")
 
+MODEL_NAME = "gemini-pro"
+
+# Providers in order of preference, see llm_backends.py
+LLM_BACKENDS = [name.strip() for name in os.getenv("LLM_BACKENDS", "gemini").split(",") if name.strip()]
+
+ANALYSIS_PROMPT = "Ты опытный врач. Проанализируй медицинский анализ, выдели важные отклонения и дай рекомендации.\n\n"
+
+PROMPT_CHAR_LIMIT = 30000
+
+# "compact" sends parsed lab results (see lab_results.py), "raw" the page text as is
+PROMPT_FORMAT = os.getenv("PROMPT_FORMAT", "compact")
+COMPACT_PROMPT = PROMPT_FORMAT == "compact"
+
+# Pages past this much text would be cut from the prompt anyway, so they are not parsed.
+# Compacting shrinks the text several times, so compact mode reads further.
+TEXT_CHAR_BUDGET = (PROMPT_CHAR_LIMIT - len(ANALYSIS_PROMPT)) * (4 if COMPACT_PROMPT else 1)
+TEXT_VARIANT = f"{PROMPT_FORMAT}{lab_results.FORMAT_VERSION}:{TEXT_CHAR_BUDGET}"
+
+# Cached analyses are keyed on this, so editing the prompt never serves stale answers
+PROMPT_VERSION = sha256_hex(ANALYSIS_PROMPT + TEXT_VARIANT)[:12]
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "10"))
+
 # Configure Gemini
-try:
-    GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-    if not GOOGLE_API_KEY:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+if "gemini" in LLM_BACKENDS:
+    try:
+        GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+        if not GOOGLE_API_KEY:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
 
-    genai.configure(api_key=GOOGLE_API_KEY)  # 👈 Удалили api_version
+        # GEMINI_API_ENDPOINT points the SDK at a local stub server for testing
+        GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+        if GEMINI_API_ENDPOINT:
+            genai.configure(api_key=GOOGLE_API_KEY, transport="rest",
+                            client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=GOOGLE_API_KEY)  # 👈 Удалили api_version
+        logger.info("Gemini AI initialized successfully")
 
-    model = genai.GenerativeModel(model_name="gemini-pro")
-    logger.info("Gemini AI initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize Gemini AI: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        raise Exception("Failed to initialize Gemini AI")
+
+llm = LLMRouter.from_env(LLM_BACKENDS, MODEL_NAME)
+logger.info(f"LLM backends: {', '.join(LLM_BACKENDS)}, hedging {'on' if llm.hedge else 'off'}")
+
+# PDF extraction runs in worker processes, see pdf_pool.py
+pdf_pool = None
+analysis_cache = None
+job_queue = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global pdf_pool, analysis_cache, job_queue
+    pdf_pool = PdfPool.from_env()
+    pdf_pool.start()
+    analysis_cache = AnalysisCache.from_env()
+    job_queue = JobQueue.from_env(run_job)
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    pdf_pool.shutdown()
+    analysis_cache.close()
 
-except Exception as e:
-    logger.error(f"Failed to initialize Gemini AI: {str(e)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
-    raise Exception("Failed to initialize Gemini AI")
 
 # FastAPI
 app = FastAPI(
@@ -45,9 +113,21 @@ app = FastAPI(
     description="API for analyzing medical PDF documents using Google Gemini AI",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+app.add_middleware(UploadLimitMiddleware, path_limits={"/jobs": MAX_BATCH_UPLOAD_BYTES})
+
+app.add_middleware(MetricsMiddleware)
+
+# X-Profile: 1 with X-Admin-Token returns a collapsed-stack profile of the request instead of its body
+if PROFILING_ENABLED and not ADMIN_TOKEN:
+    logger.warning("PROFILING_ENABLED is set but ADMIN_TOKEN is not, request profiling stays off")
+elif PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, token=ADMIN_TOKEN)
+    logger.info("Request profiling enabled")
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -78,80 +158,395 @@ async def root():
             "/docs": "Swagger UI",
             "/redoc": "ReDoc UI",
             "/analyze": "POST endpoint for medical PDF analysis",
+            "/analyze/stream": "POST endpoint streaming analysis progress as Server-Sent Events",
+            "/jobs": "POST several PDFs for background analysis, returns job ids",
+            "/jobs/{id}": "GET batch job status and result",
             "/test_gemini": "POST endpoint for testing Gemini with text",
-            "/list_models": "GET endpoint to list available Gemini models"
+            "/list_models": "GET endpoint to list available Gemini models",
+            "/admin/cache": "GET cache statistics, DELETE to invalidate (requires X-Admin-Token)",
+            "/metrics": "GET Prometheus metrics"
         }
     }
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "llm_backends": llm.status()
+    }
+
+
+SERVICE_ERRORS = (PoolBusy, ExtractionTimeout, GeminiUnavailable, GeminiTimeout,
+                  BackendUnavailable, BackendTimeout, JobQueueFull)
+
+
+def new_request_id() -> str:
+    # the random suffix keeps concurrent requests apart in the logs
+    return f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+
+
+def service_error(e: Exception) -> HTTPException:
+    if isinstance(e, PoolBusy):
+        return HTTPException(
+            status_code=503,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, GeminiUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail="Gemini is temporarily unavailable",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, BackendUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail="Analysis service is temporarily unavailable",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, JobQueueFull):
+        return HTTPException(
+            status_code=503,
+            detail="Too many batch jobs queued, try again later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, ExtractionTimeout):
+        return HTTPException(status_code=422, detail="PDF is too complex to process")
+    return HTTPException(status_code=504, detail=str(e))
+
+
+def join_pages(request_id: str, pages: list) -> str:
+    for i, text in enumerate(pages, 1):
+        if text:
+            logger.debug(f"[{request_id}] Extracted text from page {i}")
+        else:
+            logger.debug(f"[{request_id}] Page {i} has no extractable text")
+    if not COMPACT_PROMPT:
+        return "".join(text + "\n" for text in pages if text)
+
+    text, result_count = lab_results.compact_text(pages)
+    logger.info(f"[{request_id}] Compact prompt: {result_count} lab results, {len(text)} chars")
+    return text
+
+
+def build_prompt(request_id: str, pdf_text: str) -> str:
+    prompt = ANALYSIS_PROMPT + pdf_text
+
+    if len(prompt) > PROMPT_CHAR_LIMIT:
+        logger.warning(f"[{request_id}] Prompt too long, truncating")
+        prompt = prompt[:PROMPT_CHAR_LIMIT] + "\n...[текст был сокращён]..."
+    PROMPT_CHARS.observe(len(prompt))
+    return prompt
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def receive_upload(file: UploadFile, directory: str = None) -> SpooledUpload:
+    with stage("upload_read"):
+        upload = await spool_upload(file, directory=directory)
+    UPLOAD_BYTES.observe(upload.size)
+    return upload
+
+
+async def run_analysis(request_id: str, upload: SpooledUpload) -> tuple:
+    """Returns (analysis, served_from_cache) for a spooled PDF."""
+    pdf_hash = upload.sha256
+    result_key = analysis_key(pdf_hash, PROMPT_VERSION, llm.model_name)
+    cached = await analysis_cache.get(result_key)
+    if cached is not None:
+        CACHE_LOOKUPS.labels("hit").inc()
+        logger.info(f"[{request_id}] Analysis served from cache")
+        return cached, True
+    CACHE_LOOKUPS.labels("miss").inc()
+
+    pdf_text = await analysis_cache.get(text_key(pdf_hash, TEXT_VARIANT))
+    if pdf_text is None:
+        pages = await pdf_pool.extract_pages(upload.path, TEXT_CHAR_BUDGET, COMPACT_PROMPT)
+        with stage("prompt_build"):
+            pdf_text = join_pages(request_id, pages)
+        await analysis_cache.set(text_key(pdf_hash, TEXT_VARIANT), pdf_text)
+
+    if not pdf_text.strip():
+        raise HTTPException(status_code=400, detail="No readable text in PDF")
+
+    prompt = build_prompt(request_id, pdf_text)
+    with stage("llm_call"):
+        analysis = await llm.generate(prompt)
+
+    if not analysis:
+        raise ValueError("Empty response from Gemini")
+
+    await analysis_cache.set(result_key, analysis, PROMPT_VERSION)
+    logger.info(f"[{request_id}] Gemini analysis completed")
+    return analysis, False
+
+
+async def run_job(job: Job) -> str:
+    upload = await asyncio.to_thread(SpooledUpload.from_path, job.path)
+    logger.info(f"[{job.id}] Batch job started - Filename: {job.filename}, {upload.size} bytes")
+    # Unlike interactive requests, batch jobs wait out a busy pool or an open breaker
+    for attempt in range(JOB_MAX_ATTEMPTS):
+        try:
+            analysis, _ = await run_analysis(job.id, upload)
+            return analysis
+        except (PoolBusy, GeminiUnavailable, BackendUnavailable) as e:
+            if attempt == JOB_MAX_ATTEMPTS - 1:
+                raise
+            logger.info(f"[{job.id}] {type(e).__name__}, retrying in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+
 
 @app.post("/analyze")
-async def analyze_pdf(file: UploadFile = File(...)):
-    request_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+async def analyze_pdf(file: UploadFile = File(...), accept: str = Header(None)):
+    if accept and "text/event-stream" in accept:
+        return await analyze_pdf_stream(file)
+
+    request_id = new_request_id()
     logger.info(f"[{request_id}] New request - Filename: {file.filename}")
 
+    upload = None
     try:
         if not file.filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail="File must be a PDF")
 
-        contents = await file.read()
-        logger.info(f"[{request_id}] PDF size: {len(contents)} bytes")
+        upload = await receive_upload(file)
+        logger.info(f"[{request_id}] PDF size: {upload.size} bytes")
+        if not upload.size:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
 
-        pdf_text = ""
-        with pdfplumber.open(io.BytesIO(contents)) as pdf:
-            for i, page in enumerate(pdf.pages, 1):
-                text = page.extract_text()
-                if text:
-                    pdf_text += text + "\n"
-                    logger.info(f"[{request_id}] Extracted text from page {i}")
-                else:
-                    logger.warning(f"[{request_id}] Page {i} has no extractable text")
+        analysis, cached = await run_analysis(request_id, upload)
+        with stage("serialize"):
+            return JSONResponse(content={"analysis": analysis}, headers={"X-Cache": "HIT" if cached else "MISS"})
 
-        if not pdf_text.strip():
-            raise HTTPException(status_code=400, detail="No readable text in PDF")
+    except HTTPException:
+        raise
+    except SERVICE_ERRORS as e:
+        logger.warning(f"[{request_id}] {type(e).__name__}: {str(e)}")
+        raise service_error(e)
+    except Exception as e:
+        logger.error(f"[{request_id}] Error: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Error analyzing medical data: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.remove()
 
-        prompt = (
-            "Ты опытный врач. Проанализируй медицинский анализ, выдели важные отклонения и дай рекомендации.\n\n"
-            + pdf_text
-        )
 
-        if len(prompt) > 30000:
-            logger.warning(f"[{request_id}] Prompt too long, truncating")
-            prompt = prompt[:30000] + "\n...[текст был сокращён]..."
+async def analysis_events(request_id: str, upload):
+    started = time.monotonic()
+    yield sse_event("start", {"request_id": request_id, "size": upload.size})
 
-        chat = model.start_chat()
-        response = chat.send_message(prompt)
+    try:
+        pdf_hash = upload.sha256
+        result_key = analysis_key(pdf_hash, PROMPT_VERSION, llm.model_name)
+        cached = await analysis_cache.get(result_key)
+        if cached is not None:
+            CACHE_LOOKUPS.labels("hit").inc()
+            logger.info(f"[{request_id}] Analysis served from cache")
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {"cached": True, "chars": len(cached),
+                                     "elapsed": round(time.monotonic() - started, 3)})
+            return
+        CACHE_LOOKUPS.labels("miss").inc()
 
-        if not response.text:
+        pdf_text = await analysis_cache.get(text_key(pdf_hash, TEXT_VARIANT))
+        if pdf_text is None:
+            pages = []
+            async for start, texts, page_count in pdf_pool.iter_chunks(upload.path, TEXT_CHAR_BUDGET, COMPACT_PROMPT):
+                pages.extend(texts)
+                for i, text in enumerate(texts, start + 1):
+                    yield sse_event("page", {"page": i, "pages": page_count, "has_text": bool(text)})
+            with stage("prompt_build"):
+                pdf_text = join_pages(request_id, pages)
+            await analysis_cache.set(text_key(pdf_hash, TEXT_VARIANT), pdf_text)
+
+        if not pdf_text.strip():
+            raise HTTPException(status_code=400, detail="No readable text in PDF")
+        yield sse_event("extracted", {"chars": len(pdf_text)})
+
+        # Chunks go straight to the client; only the joined text is kept for the cache.
+        # llm_call here includes time the client takes to read the tokens.
+        parts = []
+        with stage("llm_call"):
+            async for text in llm.stream(build_prompt(request_id, pdf_text)):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        analysis = "".join(parts)
+
+        if not analysis:
             raise ValueError("Empty response from Gemini")
 
-        logger.info(f"[{request_id}] Gemini analysis completed")
-        return JSONResponse(content={"analysis": response.text})
+        await analysis_cache.set(result_key, analysis, PROMPT_VERSION)
+        logger.info(f"[{request_id}] Gemini analysis streamed")
+        yield sse_event("done", {"cached": False, "chars": len(analysis),
+                                 "elapsed": round(time.monotonic() - started, 3)})
 
+    except (HTTPException, *SERVICE_ERRORS) as e:
+        error = e if isinstance(e, HTTPException) else service_error(e)
+        logger.warning(f"[{request_id}] Stream failed: {error.detail}")
+        yield sse_event("error", {"status": error.status_code, "detail": error.detail})
     except Exception as e:
         logger.error(f"[{request_id}] Error: {str(e)}")
         logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Error analyzing medical data: {str(e)}")
+        yield sse_event("error", {"status": 500, "detail": f"Error analyzing medical data: {str(e)}"})
+
+
+@app.post("/analyze/stream")
+async def analyze_pdf_stream(file: UploadFile = File(...)):
+    """
+    Потоковый вариант /analyze (Server-Sent Events): события page по мере
+    извлечения страниц, token с фрагментами ответа Gemini, затем done или error.
+    """
+    request_id = new_request_id()
+    logger.info(f"[{request_id}] New streaming request - Filename: {file.filename}")
+
+    if not file.filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    if pdf_pool.busy:
+        raise service_error(PoolBusy(pdf_pool.retry_after))
+
+    upload = await receive_upload(file)
+    logger.info(f"[{request_id}] PDF size: {upload.size} bytes")
+    if not upload.size:
+        upload.remove()
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    # The background task also runs when the client disconnects mid-stream
+    return StreamingResponse(
+        analysis_events(request_id, upload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(upload.remove)
+    )
+
+
+@app.post("/jobs", status_code=202)
+async def create_jobs(files: list[UploadFile] = File(...), webhook_url: str = Form(None)):
+    """
+    Пакетный анализ: принимает несколько PDF и сразу возвращает id заданий.
+    Статус и результат - GET /jobs/{id}; если указан webhook_url, по завершении
+    каждого задания туда отправляется POST с тем же JSON.
+    Задания ставятся в очередь все вместе или ни одно, если какой-то файл не прошёл проверку.
+    """
+    if any(not file.filename.endswith(".pdf") for file in files):
+        raise HTTPException(status_code=400, detail="All files must be PDFs")
+    if webhook_url:
+        try:
+            await asyncio.to_thread(check_webhook_url, webhook_url, job_queue.webhook_hosts)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if len(files) > job_queue.free_slots():
+        raise service_error(JobQueueFull(job_queue.retry_after))
+
+    uploads, queued = [], False
+    try:
+        for file in files:
+            uploads.append(await receive_upload(file, directory=job_queue.jobs_dir))
+        jobs = [Job(file.filename, upload.path, webhook_url) for file, upload in zip(files, uploads)]
+        await job_queue.submit(jobs)
+        queued = True
+    except JobQueueFull as e:
+        raise service_error(e)
+    finally:
+        if not queued:
+            for upload in uploads:
+                upload.remove()
+
+    for job in jobs:
+        logger.info(f"[{job.id}] Batch job queued - Filename: {job.filename}")
+    return {"jobs": [{"id": job.id, "filename": job.filename, "status": job.status} for job in jobs]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
 
 @app.post("/test_gemini")
 async def test_gemini(text: str = "Привет, Gemini!"):
     """
     Эндпоинт для проверки базовой работы с Gemini API и текстовыми запросами.
     Отправляет простой текстовый запрос и возвращает ответ.
+    Запрос идёт через тот же выбор бэкенда, что и /analyze (LLM_BACKENDS).
     """
     logger.info(f"Testing Gemini with text: '{text}'")
     try:
-        model = genai.GenerativeModel(model_name="gemini-pro")
-        response = model.generate_content(text)
-        if response and response.text:
-            logger.info(f"Gemini test successful, response: '{response.text[:50]}...'")
-            return JSONResponse(content={"response": response.text})
+        response = await llm.generate(text)
+        if response:
+            logger.info(f"Gemini test successful, response: '{response[:50]}...'")
+            return JSONResponse(content={"response": response})
         else:
             logger.warning("Gemini test returned an empty response.")
             raise HTTPException(status_code=500, detail="Empty response from Gemini")
+    except HTTPException:
+        raise
+    except SERVICE_ERRORS as e:
+        raise service_error(e)
     except Exception as e:
         logger.error(f"Error during Gemini test: {str(e)}")
         logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Error testing Gemini: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error testing Gemini: {str(e)}")
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled, set ADMIN_TOKEN to enable it")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def cache_stats():
+    """
+    Статистика кэша анализов: попадания, промахи, вытеснения и размер.
+    Счётчики и размер памяти относятся только к воркеру uvicorn, ответившему
+    на запрос (его pid в worker_pid); суммы по всем воркерам - метрика
+    analysis_cache_lookups_total на /metrics.
+    """
+    stats = await analysis_cache.stats()
+    return {"prompt_version": PROMPT_VERSION, "model": llm.model_name, "worker_pid": os.getpid(), "stats": stats}
+
+@app.delete("/admin/cache", dependencies=[Depends(require_admin)])
+async def cache_invalidate(prompt_version: str = None):
+    """
+    Удаляет из кэша анализы, сделанные с указанной версией промпта.
+    Без параметра очищает кэш полностью, включая извлечённый текст.
+    """
+    removed = await analysis_cache.invalidate(prompt_version)
+    logger.info(f"Cache invalidated (prompt_version={prompt_version}), {removed} entries removed")
+    return {"removed": removed}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Medical Analysis API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--pdf-workers", type=int, help="PDF extraction processes per uvicorn worker")
+    parser.add_argument("--pdf-max-pending", type=int, help="documents allowed to wait for extraction before 503")
+    parser.add_argument("--pdf-job-timeout", type=float, help="CPU seconds allowed per extraction job")
+    parser.add_argument("--job-workers", type=int, help="concurrent batch jobs per uvicorn worker")
+    args = parser.parse_args()
+
+    # The pool reads its settings from the environment on startup, which also
+    # makes them visible to every uvicorn worker process.
+    for name, value in (("PDF_WORKERS", args.pdf_workers),
+                        ("PDF_MAX_PENDING", args.pdf_max_pending),
+                        ("PDF_JOB_TIMEOUT", args.pdf_job_timeout),
+                        ("JOB_WORKERS", args.job_workers)):
+        if value is not None:
+            os.environ[name] = str(value)
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,96 @@
+"""
+Prometheus metrics for the analysis pipeline.
+
+Stage timings, document sizes and LLM token counts are recorded where they
+happen (main.py, pdf_pool.py, gemini_client.py) and exposed on /metrics.
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so that /metrics
+aggregates all of them.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+_SIZE_BUCKETS = (1e4, 5e4, 1e5, 5e5, 1e6, 2e6, 5e6, 1e7, 2e7, 5e7)
+_PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+_CHAR_BUCKETS = (500, 1000, 2500, 5000, 10000, 20000, 30000, 60000)
+_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+    buckets=_STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "analysis_stage_duration_seconds",
+    "Time spent in each stage of the analysis pipeline "
+    "(upload_read, pdf_open, page_extract, prompt_build, llm_call, serialize)",
+    ["stage"],
+    buckets=_STAGE_BUCKETS,
+)
+UPLOAD_BYTES = Histogram("analysis_upload_bytes", "Size of uploaded PDFs", buckets=_SIZE_BUCKETS)
+PDF_PAGES = Histogram("analysis_pdf_pages", "Pages per uploaded PDF", buckets=_PAGE_BUCKETS)
+PROMPT_CHARS = Histogram("analysis_prompt_chars", "Characters sent to the LLM per prompt", buckets=_CHAR_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM", ["kind"])
+CACHE_LOOKUPS = Counter("analysis_cache_lookups_total", "Analysis cache lookups", ["result"])
+LLM_REQUESTS = Counter("llm_requests_total", "LLM backend calls by outcome (ok, error, rejected, cancelled)", ["backend", "result"])
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Hedged LLM requests by which call answered first", ["winner"])
+
+
+def stage(name: str):
+    """Context manager timing one pipeline stage: `with stage("llm_call"): ...`"""
+    return STAGE_SECONDS.labels(name).time()
+
+
+def record_usage(usage):
+    """Counts tokens from a Gemini `usage_metadata` or an OpenAI `usage`, if the response has one."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_token_count", None) or getattr(usage, "prompt_tokens", 0)
+    completion = getattr(usage, "candidates_token_count", None) or getattr(usage, "completion_tokens", 0)
+    LLM_TOKENS.labels("prompt").inc(prompt or 0)
+    LLM_TOKENS.labels("completion").inc(completion or 0)
+
+
+def render() -> tuple:
+    """Returns (body, content_type) for the /metrics endpoint."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """Records latency per route template, so /jobs/{job_id} stays one series."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
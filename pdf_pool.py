@@ -0,0 +1,248 @@
+"""
+Process pool for PDF text extraction.
+
+pdfplumber is pure Python and CPU bound, so parsing a large report directly in
+an async handler stalls the whole event loop. Extraction jobs are sent to a
+pool of worker processes instead; long documents are split into page ranges
+that are parsed in parallel.
+"""
+import asyncio
+import io
+import logging
+import mmap
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import pdfplumber
+
+from lab_results import page_text_with_tables
+from metrics import PDF_PAGES, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusy(Exception):
+    """Raised when too many documents are already waiting for extraction."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("PDF extraction queue is full")
+        self.retry_after = retry_after
+
+
+class ExtractionTimeout(Exception):
+    """Raised when an extraction job exceeds its CPU time budget."""
+
+
+# --- Worker side -------------------------------------------------------------
+
+class _CpuLimitExceeded(BaseException):
+    # Raised from the signal handler; not an Exception, so the `except Exception`
+    # blocks inside pdfminer cannot swallow it and leave the job unlimited.
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise _CpuLimitExceeded()
+
+
+@contextmanager
+def _open(source):
+    if isinstance(source, (bytes, bytearray)):
+        with pdfplumber.open(io.BytesIO(source)) as pdf:
+            yield pdf
+        return
+    # Memory-map spooled uploads: pages are read straight from the page cache
+    # instead of every worker holding its own copy of the file.
+    with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with pdfplumber.open(data) as pdf:
+            yield pdf
+
+
+def _with_cpu_limit(cpu_timeout: float, fn, *args):
+    # ITIMER_PROF counts CPU time of this process, so time spent waiting in
+    # the executor queue is not charged to the job.
+    limited = cpu_timeout > 0 and hasattr(signal, "ITIMER_PROF")
+    if limited:
+        signal.signal(signal.SIGPROF, _on_cpu_limit)
+        signal.setitimer(signal.ITIMER_PROF, cpu_timeout)
+    try:
+        return fn(*args)
+    except _CpuLimitExceeded:
+        raise ExtractionTimeout("PDF extraction exceeded its CPU time limit") from None
+    finally:
+        if limited:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+
+
+def iter_page_texts(pdf, start: int, stop: int, tables: bool = False):
+    """Yields page texts one at a time, dropping each page's parsed layout after use."""
+    for page in pdf.pages[start:stop]:
+        yield page_text_with_tables(page) if tables else page.extract_text() or ""
+        page.flush_cache()
+
+
+def _timed_pages(pdf, start: int, stop: int, tables: bool):
+    texts, seconds = [], []
+    started = time.perf_counter()
+    for text in iter_page_texts(pdf, start, stop, tables):
+        texts.append(text)
+        now = time.perf_counter()
+        seconds.append(now - started)
+        started = now
+    return texts, seconds
+
+
+# Jobs return their timings as well; metrics are recorded in the parent process.
+
+def _extract_range(source, start: int, stop: int, tables: bool):
+    started = time.perf_counter()
+    with _open(source) as pdf:
+        len(pdf.pages)  # parses the page tree, like _extract_head
+        open_seconds = time.perf_counter() - started
+        return (*_timed_pages(pdf, start, stop, tables), open_seconds)
+
+
+def _extract_head(source, stop: int, tables: bool):
+    started = time.perf_counter()
+    with _open(source) as pdf:
+        page_count = len(pdf.pages)
+        open_seconds = time.perf_counter() - started
+        return (page_count, *_timed_pages(pdf, 0, stop, tables), open_seconds)
+
+
+def _observe(page_seconds: list, open_seconds: float):
+    STAGE_SECONDS.labels("pdf_open").observe(open_seconds)
+    for seconds in page_seconds:
+        STAGE_SECONDS.labels("page_extract").observe(seconds)
+
+
+def extract_range_job(source, start: int, stop: int, tables: bool, cpu_timeout: float):
+    return _with_cpu_limit(cpu_timeout, _extract_range, source, start, stop, tables)
+
+
+def extract_head_job(source, stop: int, tables: bool, cpu_timeout: float):
+    return _with_cpu_limit(cpu_timeout, _extract_head, source, stop, tables)
+
+
+# --- Event loop side ---------------------------------------------------------
+
+class PdfPool:
+    def __init__(self, workers: int, max_pending: int, job_timeout: float,
+                 pages_per_chunk: int, retry_after: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self.pages_per_chunk = pages_per_chunk
+        self.retry_after = retry_after
+        self._executor = None
+        self._pending = 0
+
+    @classmethod
+    def from_env(cls) -> "PdfPool":
+        workers = int(os.getenv("PDF_WORKERS") or os.cpu_count() or 1)
+        return cls(
+            workers=workers,
+            max_pending=int(os.getenv("PDF_MAX_PENDING") or workers * 4),
+            job_timeout=float(os.getenv("PDF_JOB_TIMEOUT", "60")),
+            pages_per_chunk=int(os.getenv("PDF_PAGES_PER_CHUNK", "8")),
+            retry_after=int(os.getenv("PDF_RETRY_AFTER", "5")),
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def busy(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def start(self):
+        # spawn instead of fork: uvicorn already runs threads in this process
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"PDF pool started: {self.workers} workers, max {self.max_pending} pending documents")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Every job in flight sees the same broken pool; only the first one
+            # restarts it, later ones must not shut down the replacement.
+            if self._executor is executor:
+                logger.error("PDF worker process died, restarting pool")
+                self.shutdown()
+                self.start()
+            raise
+
+    async def iter_chunks(self, source, char_budget: int = None, tables: bool = False):
+        """
+        Yields (first_page_index, page_texts, page_count) for consecutive page
+        ranges, in page order. Pages without a text layer come back as "".
+        `source` is either the raw PDF bytes or a path to the file.
+
+        With `char_budget`, no further pages are parsed once the text gathered
+        so far is at least that long. With `tables`, ruled tables come back one
+        row per line, see lab_results.page_text_with_tables.
+        """
+        if self.busy:
+            raise PoolBusy(self.retry_after)
+
+        self._pending += 1
+        window = deque()
+        try:
+            chunk = self.pages_per_chunk
+            page_count, texts, page_seconds, open_seconds = await self._run(
+                extract_head_job, source, chunk, tables, self.job_timeout
+            )
+            PDF_PAGES.observe(page_count)
+            _observe(page_seconds, open_seconds)
+            yield 0, texts, page_count
+            chars = sum(len(text) + 1 for text in texts if text)
+
+            async def run_range(start):
+                texts, page_seconds, open_seconds = await self._run(
+                    extract_range_job, source, start, start + chunk, tables, self.job_timeout
+                )
+                _observe(page_seconds, open_seconds)
+                return start, texts
+
+            # Keep at most one range per worker in flight so an exhausted budget
+            # leaves little parsing work to throw away.
+            starts = iter(range(chunk, page_count, chunk))
+            while char_budget is None or chars < char_budget:
+                while len(window) < self.workers:
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    window.append(asyncio.ensure_future(run_range(start)))
+                if not window:
+                    break
+                start, texts = await window.popleft()
+                yield start, texts, page_count
+                chars += sum(len(text) + 1 for text in texts if text)
+        finally:
+            for job in window:
+                job.cancel()
+            self._pending -= 1
+
+    async def extract_pages(self, source, char_budget: int = None, tables: bool = False) -> list:
+        """Returns the text of each parsed page, in page order."""
+        pages = []
+        async for _, texts, _ in self.iter_chunks(source, char_budget, tables):
+            pages.extend(texts)
+        return pages
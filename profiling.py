@@ -0,0 +1,99 @@
+"""
+Opt-in sampling profiler for single requests.
+
+With PROFILING_ENABLED=1, a request sent with the header `X-Profile: 1` and
+the admin token in `X-Admin-Token` (the same ADMIN_TOKEN as /admin/cache) is
+run while a background thread samples the event loop thread's stack every
+PROFILE_INTERVAL_MS. Instead of the normal body, the response is the profile
+in collapsed-stack format ("frame;frame;frame count" per line), which
+flamegraph.pl, speedscope and inferno read directly. The original status is
+returned in X-Profile-Status. Without a valid token the header is ignored and
+the request is served as usual: a profile shows every concurrent request.
+
+Samples cover everything running on the loop during the request, including
+other concurrent requests; PDF extraction in worker processes is not seen.
+"""
+import asyncio
+import hmac
+import os
+import sys
+import threading
+from collections import Counter
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_fold(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, token: str):
+        self.app = app
+        self.token = token.encode()
+
+    def _authorized(self, headers: dict) -> bool:
+        return headers.get(b"x-profile") == b"1" and hmac.compare_digest(
+            headers.get(b"x-admin-token", b""), self.token
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._authorized(dict(scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            # joining the sampler thread would block the loop for up to one interval
+            profile = (await asyncio.to_thread(profiler.stop)).encode("utf-8")
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(profile)).encode()),
+                (b"x-profile-status", str(status).encode()),
+                (b"x-profile-samples", str(sum(profiler.samples.values())).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": profile})
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from cache import AnalysisCache, analysis_key, text_key
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_memory_tier_evicts_least_recently_used_by_count():
+    cache = AnalysisCache(max_entries=2, marker_path=None)
+    run(cache.set("text:a:v", "a"))
+    run(cache.set("text:b:v", "b"))
+    assert run(cache.get("text:a:v")) == "a"
+    run(cache.set("text:c:v", "c"))
+
+    assert run(cache.get("text:b:v")) is None
+    assert run(cache.get("text:a:v")) == "a"
+    assert run(cache.stats())["evictions"] == 1
+
+
+def test_memory_tier_evicts_by_size():
+    cache = AnalysisCache(max_bytes=10, marker_path=None)
+    run(cache.set("text:a:v", "x" * 6))
+    run(cache.set("text:b:v", "y" * 6))
+    run(cache.set("text:c:v", "z" * 11))
+
+    stats = run(cache.stats())
+    assert run(cache.get("text:a:v")) is None
+    assert run(cache.get("text:b:v")) == "y" * 6
+    # an entry larger than the whole tier is not cached at all
+    assert run(cache.get("text:c:v")) is None
+    assert stats["memory_bytes"] == 6
+
+
+def test_memory_tier_expires_entries():
+    cache = AnalysisCache(ttl=0.05, marker_path=None)
+    run(cache.set("text:a:v", "a"))
+    time.sleep(0.1)
+
+    assert run(cache.get("text:a:v")) is None
+    assert run(cache.stats())["expirations"] == 1
+
+
+def test_invalidation_reaches_other_workers(tmp_path):
+    marker = str(tmp_path / "invalidations")
+    first = AnalysisCache(marker_path=marker)
+    second = AnalysisCache(marker_path=marker)
+    key = analysis_key("pdf", "v1", "model")
+    for cache in (first, second):
+        run(cache.set(key, "analysis", "v1"))
+    assert run(second.get(key)) == "analysis"
+
+    run(first.invalidate())
+
+    assert run(second.get(key)) is None
+    # entries cached after the invalidation are served again
+    run(second.set(key, "fresh analysis", "v1"))
+    assert run(second.get(key)) == "fresh analysis"
+
+
+def test_invalidating_a_prompt_version_keeps_text_and_other_versions(tmp_path):
+    marker = str(tmp_path / "invalidations")
+    first = AnalysisCache(marker_path=marker)
+    second = AnalysisCache(marker_path=marker)
+    old, new, text = analysis_key("pdf", "v1", "model"), analysis_key("pdf", "v2", "model"), text_key("pdf", "c1")
+    run(second.set(old, "old analysis", "v1"))
+    run(second.set(new, "new analysis", "v2"))
+    run(second.set(text, "page text"))
+
+    run(first.invalidate("v1"))
+
+    assert run(second.get(old)) is None
+    assert run(second.get(new)) == "new analysis"
+    assert run(second.get(text)) == "page text"
+    stats = run(second.stats())
+    assert stats["text"]["memory_hits"] == 1
+    assert stats["analysis"] == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+
+
+def test_disk_tier_is_shared_and_invalidated(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    first = AnalysisCache(db_path, marker_path=None)
+    second = AnalysisCache(db_path, marker_path=None)
+    key = analysis_key("pdf", "v1", "model")
+    run(first.set(key, "analysis", "v1"))
+
+    assert run(second.get(key)) == "analysis"
+    assert run(second.stats())["analysis"]["disk_hits"] == 1
+    assert run(first.invalidate("v1")) == 1
+    assert run(AnalysisCache(db_path, marker_path=None).get(key)) is None
+
+
+def test_disk_prune_drops_expired_and_oldest_rows(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(db_path, max_entries=0, disk_max_bytes=1000, disk_ttl=3600, marker_path=None)
+    for i in range(30):
+        run(cache.set(f"text:{i}:v", "x" * 100))
+    cache._db.execute("UPDATE entries SET created_at = created_at - 7200 WHERE key = 'text:29:v'")
+    cache._db.commit()
+
+    cache._disk_prune()
+
+    rows = cache._db.execute("SELECT key, LENGTH(value) FROM entries ORDER BY created_at DESC").fetchall()
+    assert sum(size for _, size in rows) <= 1000
+    assert "text:29:v" not in {key for key, _ in rows}
+    # the newest rows are the ones kept
+    assert rows[0][0] == "text:28:v"
+    assert len(rows) == 10
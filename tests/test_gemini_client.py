@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from gemini_client import GeminiClient, GeminiTimeout
+
+
+def make_client(chunk_delay: float, chunks: int = 5, timeout: float = 0.3) -> GeminiClient:
+    client = GeminiClient("gemini-test", max_concurrency=2, timeout=timeout, breaker_threshold=1)
+
+    async def response():
+        for i in range(chunks):
+            await asyncio.sleep(chunk_delay)
+            yield SimpleNamespace(text=f"{i} ", usage_metadata=None)
+
+    async def call(prompt, timeout, stream):
+        return response()
+
+    client._call = call
+    return client
+
+
+def test_slow_reader_is_not_a_provider_timeout():
+    client = make_client(chunk_delay=0.01)
+
+    async def read_slowly():
+        texts = []
+        async for text in client.stream("prompt"):
+            texts.append(text)
+            await asyncio.sleep(0.1)
+            if len(texts) == 2:
+                # the provider answered long ago: its slot is free while the client reads on
+                assert client._semaphore._value == 2
+        return "".join(texts)
+
+    assert asyncio.run(read_slowly()) == "0 1 2 3 4 "
+    assert client.breaker.state == "closed"
+    assert client.breaker._failures == 0
+
+
+def test_slow_provider_times_out_and_counts_as_failure():
+    client = make_client(chunk_delay=0.1)
+
+    async def read():
+        return [text async for text in client.stream("prompt")]
+
+    with pytest.raises(GeminiTimeout):
+        asyncio.run(read())
+    assert client.breaker.state == "open"
+
+
+def test_closing_the_stream_early_cancels_the_reader():
+    client = make_client(chunk_delay=0.05, chunks=20, timeout=5)
+
+    async def read_one():
+        chunks = client.stream("prompt")
+        first = await anext(chunks)
+        await chunks.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    assert asyncio.run(read_one()) == "0 "
+    assert client._semaphore._value == 2
+    assert client.breaker._failures == 0
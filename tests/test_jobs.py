@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, QUEUED, RUNNING, Job, JobQueue, SQLiteJobStore, check_webhook_url
+
+
+def run_queues(db_path, jobs_dir, count: int, seconds: float = 0.5, stale_after: float = 60) -> list:
+    """Starts `count` queues on one store, as uvicorn workers would, and returns the handled job ids."""
+    handled = []
+
+    async def handler(job):
+        handled.append(job.id)
+        await asyncio.sleep(0.01)
+        return "analysis"
+
+    async def main():
+        queues = [JobQueue(SQLiteJobStore(db_path), handler, workers=2, jobs_dir=jobs_dir, stale_after=stale_after)
+                  for _ in range(count)]
+        for queue in queues:
+            await queue.start()
+        await asyncio.sleep(seconds)
+        for queue in queues:
+            await queue.stop()
+
+    asyncio.run(main())
+    return handled
+
+
+def save(db_path, *jobs):
+    async def main():
+        store = SQLiteJobStore(db_path)
+        for job in jobs:
+            await store.save(job)
+        store.close()
+
+    asyncio.run(main())
+
+
+def load(db_path, job_id):
+    async def main():
+        store = SQLiteJobStore(db_path)
+        try:
+            return await store.get(job_id)
+        finally:
+            store.close()
+
+    return asyncio.run(main())
+
+
+def pdf(tmp_path, name: str) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"%PDF-1.4")
+    return str(path)
+
+
+def test_recovered_jobs_run_once_across_workers(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queued = [Job("a.pdf", pdf(tmp_path, f"{i}.pdf")) for i in range(5)]
+    save(db_path, *queued)
+
+    handled = run_queues(db_path, str(tmp_path), count=4)
+
+    assert sorted(handled) == sorted(job.id for job in queued)
+    assert all(load(db_path, job.id).status == DONE for job in queued)
+
+
+def test_only_stale_claims_are_recovered_at_start(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    stale = Job("stale.pdf", pdf(tmp_path, "stale.pdf"), status=RUNNING, owner="gone",
+                heartbeat_at=time.time() - 3600)
+    fresh = Job("fresh.pdf", pdf(tmp_path, "fresh.pdf"), status=RUNNING, owner="alive",
+                heartbeat_at=time.time())
+    finished = Job("done.pdf", str(tmp_path / "deleted.pdf"), status=DONE, result="analysis")
+    lost = Job("lost.pdf", str(tmp_path / "missing.pdf"))
+    save(db_path, stale, fresh, finished, lost)
+
+    handled = run_queues(db_path, str(tmp_path), count=2)
+
+    assert handled == [stale.id]
+    assert load(db_path, fresh.id).status == RUNNING
+    assert load(db_path, finished.id).status == DONE
+    assert load(db_path, lost.id).status == FAILED
+
+
+def test_orphaned_claims_are_recovered_once_stale(tmp_path):
+    # a worker restarted right after a crash: its jobs still look alive at startup
+    db_path = str(tmp_path / "jobs.sqlite3")
+    running = Job("running.pdf", pdf(tmp_path, "running.pdf"), status=RUNNING, owner="crashed",
+                  heartbeat_at=time.time())
+    waiting = Job("waiting.pdf", pdf(tmp_path, "waiting.pdf"), owner="crashed", heartbeat_at=time.time())
+    save(db_path, running, waiting)
+
+    handled = run_queues(db_path, str(tmp_path), count=2, seconds=1.5, stale_after=0.3)
+
+    assert sorted(handled) == sorted([running.id, waiting.id])
+    assert load(db_path, running.id).status == DONE
+    assert load(db_path, waiting.id).status == DONE
+
+
+def test_live_worker_keeps_its_queued_jobs(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    handled = []
+
+    async def slow_handler(job):
+        handled.append(job.id)
+        await asyncio.sleep(0.5)
+        return "analysis"
+
+    async def main():
+        busy = JobQueue(SQLiteJobStore(db_path), slow_handler, workers=1, jobs_dir=str(tmp_path), stale_after=0.15)
+        idle = JobQueue(SQLiteJobStore(db_path), slow_handler, workers=1, jobs_dir=str(tmp_path), stale_after=0.15)
+        await busy.start()
+        await idle.start()
+        await busy.submit([Job("a.pdf", pdf(tmp_path, "a.pdf")), Job("b.pdf", pdf(tmp_path, "b.pdf"))])
+        await asyncio.sleep(1.3)
+        await busy.stop()
+        await idle.stop()
+
+    asyncio.run(main())
+    # the second job waited past several stale periods but was heartbeated, so ran once
+    assert len(handled) == len(set(handled)) == 2
+
+
+def test_store_created_before_claims_is_migrated(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, path TEXT, status TEXT, result TEXT,"
+               " error TEXT, webhook_url TEXT, created_at REAL, finished_at REAL)")
+    db.execute("INSERT INTO jobs VALUES ('old', 'old.pdf', ?, ?, NULL, NULL, NULL, 0, NULL)",
+               (pdf(tmp_path, "old.pdf"), QUEUED))
+    db.commit()
+    db.close()
+
+    assert run_queues(db_path, str(tmp_path), count=1) == ["old"]
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "http:///hook",
+    "http://127.0.0.1/hook",
+    "http://10.1.2.3/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]:8080/hook",
+    "http://[::ffff:192.168.0.1]/hook",
+])
+def test_check_webhook_url_rejects_internal_targets(url):
+    with pytest.raises(ValueError):
+        check_webhook_url(url)
+
+
+def test_check_webhook_url_allowlist():
+    check_webhook_url("http://127.0.0.1:9000/hook", frozenset({"127.0.0.1"}))
+    check_webhook_url("https://8.8.8.8/hook")
+    with pytest.raises(ValueError):
+        check_webhook_url("https://8.8.8.8/hook", frozenset({"hooks.example.com"}))
@@ -0,0 +1,111 @@
+import pytest
+
+import lab_results
+from lab_results import compact_text, normalize_unit, parse_result, render_result
+
+
+@pytest.mark.parametrize("line, rendered", [
+    ("Гемоглобин 120 г/л 130-160", "Гемоглобин 120 g/L L 130-160"),
+    ("Глюкоза: 5,1 ммоль/л 3.9-6.1", "Глюкоза 5.1 mmol/L"),
+    ("T4 free 25.2 pmol/L 9-19", "T4 free 25.2 pmol/L H 9-19"),
+    ("T3 5.1 pmol/L 2.6-5.7", "T3 5.1 pmol/L"),
+    ("B12 150 pg/mL 200-900", "B12 150 pg/mL L 200-900"),
+    ("HbA1c 6.1 % 4-6", "HbA1c 6.1 % H 4-6"),
+    ("CA 19-9 45 U/mL <37", "CA 19-9 45 U/mL H <37"),
+    ("25-OH vitamin D 18 ng/mL 30-100", "25-OH vitamin D 18 ng/mL L 30-100"),
+    ("Лейкоциты 6.5 x10*9/L 4-9", "Лейкоциты 6.5 10^9/L"),
+    ("Albumin 3.5 g/dL 3.5-5.2", "Albumin 35 g/L"),
+    ("СРБ 12 мг/л ↑", "СРБ 12 mg/L H"),
+])
+def test_parse_result(line, rendered):
+    assert render_result(parse_result(line)) == rendered
+
+
+def test_parse_result_table_cells():
+    result = parse_result("Тромбоциты\t450\tx10*9/л\t150-400")
+    assert (result.name, result.value, result.unit, result.flag) == ("Тромбоциты", "450", "10^9/L", "H")
+    assert result.reference == "150-400"
+
+
+@pytest.mark.parametrize("line", [
+    "Page 2 of 3",
+    "Дата: 12.03.2024",
+    "Received 12.03.2024 10:45",
+    "Panel 4: Biochemistry",
+    "Возраст: 45",
+    "Возраст 45 лет",
+    "Calcium 2.1 mmol/L 2.2 - 2.6 fasting",
+    "Глюкоза 5.1 ммоль/л 3.9 - 6.1 натощак",
+    "ВИЧ 1,2 отрицательно",
+    "ВИЧ\t1,2\tотрицательно",
+])
+def test_parse_result_ignores_other_lines(line):
+    assert parse_result(line) is None
+
+
+@pytest.mark.parametrize("unit, normalized", [
+    ("x10*9/L", "10^9/L"),
+    ("×10^12/л", "10^12/L"),
+    ("*10⁹/мкл", "10^9/µL"),
+    ("10**9/l", "10^9/L"),
+    ("мкмоль/л", "µmol/L"),
+    ("mg/dl", "mg/dL"),
+])
+def test_normalize_unit(unit, normalized):
+    assert normalize_unit(unit) == normalized
+
+
+def test_compact_text_keeps_every_result_and_note():
+    pages = [
+        "Lab X, Moscow\nPatient: Ivanova, F, 1980\nT4 free 25.2 pmol/L 9-19\nCollected 01.03.2024\nPage 1 of 3",
+        "Lab X, Moscow\nPatient: Ivanova, F, 1980\nB12 150 pg/mL 200-900\nCollected 02.03.2024\nPage 2 of 3",
+        "Lab X, Moscow\nPatient: Ivanova, F, 1980\nB12 180 pg/mL 200-900\nCollected 03.03.2024\nPage 3 of 3",
+    ]
+    text, result_count = compact_text(pages)
+    lines = text.splitlines()
+
+    assert result_count == 3
+    assert "вне нормы (3 из 3)" in lines[0]
+    assert lines[1:] == [
+        "Lab X, Moscow",
+        "Patient: Ivanova, F, 1980",
+        "T4 free 25.2 pmol/L H 9-19",
+        "Collected 01.03.2024",
+        "Page 1 of 3",
+        "B12 150 pg/mL L 200-900",
+        "Collected 02.03.2024",
+        "B12 180 pg/mL L 200-900",
+        "Collected 03.03.2024",
+    ]
+
+
+def test_compact_text_keeps_unparsed_rows_verbatim():
+    text, result_count = compact_text(["Calcium 2.1 mmol/L 2.2 - 2.6 fasting\nCalcium 2.1 mmol/L 2.2-2.6"])
+    assert result_count == 1
+    assert text.splitlines()[1:] == ["Calcium 2.1 mmol/L 2.2 - 2.6 fasting", "Calcium 2.1 mmol/L L 2.2-2.6"]
+
+
+def test_compact_text_keeps_repeated_lines_that_are_not_boilerplate():
+    pages = [
+        "Header\nPanel 1: Biochemistry\nComment: see below",
+        "Header\nPanel 2: Hormones",
+        "Header\nPanel 3: Biochemistry\nComment: see below",
+        "Header\nPanel 4: Biochemistry",
+    ]
+    text, result_count = compact_text(pages)
+    assert result_count == 0
+    assert text.splitlines() == [
+        "Header",
+        "Panel 1: Biochemistry",
+        "Comment: see below",
+        "Panel 2: Hormones",
+        "Panel 3: Biochemistry",
+        "Comment: see below",
+        "Panel 4: Biochemistry",
+    ]
+
+
+def test_repeated_lines_masks_page_numbers_only():
+    pages = ["Стр. 1 из 2\nДата 01.03.2024", "Стр. 2 из 2\nДата 02.03.2024"]
+    assert lab_results.repeated_lines(pages) == {"#"}
+    assert lab_results.repeated_lines(pages[:1]) == set()
@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_backends import BackendUnavailable, LLMBackend, LLMRouter, StubBackend
+
+
+class Stub(StubBackend):
+    """StubBackend with its own name that counts its calls and cancellations."""
+
+    def __init__(self, name: str, latency: float = 0, error_rate: float = 0, state: str = "closed"):
+        super().__init__(latency, error_rate)
+        self.name = name
+        self._state = state
+        self.calls = 0
+        self.cancelled = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def retry_after(self) -> int:
+        return 30
+
+    async def _wait(self):
+        self.calls += 1
+        try:
+            await super()._wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def warm_up(router: LLMRouter, backend: Stub, kind: str, seconds: float, count: int = 20):
+    for _ in range(count):
+        router._stats[backend.name, kind].record(seconds)
+
+
+def test_fails_over_to_the_next_backend():
+    broken, healthy = Stub("broken", error_rate=1), Stub("healthy")
+    router = LLMRouter([broken, healthy])
+
+    assert asyncio.run(router.generate("prompt")).startswith("[stub]")
+    assert (broken.calls, healthy.calls) == (1, 1)
+    assert router.status()["broken"]["generate"]["error_rate"] == 1.0
+
+
+def test_raises_the_last_error_when_every_backend_fails():
+    router = LLMRouter([Stub("a", error_rate=1), Stub("b", error_rate=1)])
+
+    with pytest.raises(BackendUnavailable):
+        asyncio.run(router.generate("prompt"))
+
+
+class Blocking(LLMBackend):
+    """Rejects every prompt the way a safety block or a 400 does."""
+
+    name = "blocking"
+    model_name = "blocking"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        raise ValueError("Prompt was blocked")
+
+
+def test_does_not_fail_over_on_errors_caused_by_the_request():
+    blocking, healthy = Blocking(), Stub("healthy")
+    router = LLMRouter([blocking, healthy])
+
+    with pytest.raises(ValueError, match="blocked"):
+        asyncio.run(router.generate("prompt"))
+    assert (blocking.calls, healthy.calls) == (1, 0)
+    assert router.status()["blocking"]["generate"]["error_rate"] == 0.0
+
+
+def test_skips_backends_with_an_open_circuit():
+    tripped, healthy = Stub("tripped", state="open"), Stub("healthy")
+
+    asyncio.run(LLMRouter([tripped, healthy]).generate("prompt"))
+    assert (tripped.calls, healthy.calls) == (0, 1)
+
+    with pytest.raises(BackendUnavailable) as raised:
+        asyncio.run(LLMRouter([tripped]).generate("prompt"))
+    assert raised.value.retry_after == 30
+
+
+def test_prefers_the_faster_backend_and_demotes_erroring_ones():
+    slow, fast = Stub("slow"), Stub("fast")
+    router = LLMRouter([slow, fast])
+    warm_up(router, slow, "generate", 2.0)
+    warm_up(router, fast, "generate", 0.5)
+    assert router._ranked("generate") == [fast, slow]
+
+    for _ in range(30):
+        router._stats[fast.name, "generate"].record(None)
+    assert router._ranked("generate") == [slow, fast]
+
+
+def test_hedges_a_slow_call_and_cancels_the_loser():
+    primary, secondary = Stub("primary", latency=2.0), Stub("secondary")
+    router = LLMRouter([primary, secondary], hedge=True, hedge_min_samples=20)
+    warm_up(router, primary, "generate", 0.05)
+    warm_up(router, secondary, "generate", 0.1)
+
+    started = time.monotonic()
+    asyncio.run(router.generate("prompt"))
+
+    assert time.monotonic() - started < 1.0
+    assert (primary.calls, secondary.calls) == (1, 1)
+    assert (primary.cancelled, secondary.cancelled) == (1, 0)
+    # the cancelled call is not counted as a latency sample or an error
+    assert router.status()["primary"]["generate"]["samples"] == 20
+
+
+def test_does_not_hedge_without_enough_samples():
+    primary, secondary = Stub("primary", latency=0.3), Stub("secondary")
+    router = LLMRouter([primary, secondary], hedge=True, hedge_min_samples=20)
+    warm_up(router, primary, "generate", 0.01, count=5)
+    warm_up(router, secondary, "generate", 0.1, count=5)
+
+    asyncio.run(router.generate("prompt"))
+    assert (primary.calls, secondary.calls) == (1, 0)
+
+
+def test_stream_hedges_on_the_first_chunk():
+    primary, secondary = Stub("primary", latency=2.0), Stub("secondary")
+    router = LLMRouter([primary, secondary], hedge=True, hedge_min_samples=20)
+    warm_up(router, primary, "stream", 0.05)
+    warm_up(router, secondary, "stream", 0.1)
+
+    async def collect():
+        return "".join([chunk async for chunk in router.stream("prompt")])
+
+    started = time.monotonic()
+    assert asyncio.run(collect()).startswith("[stub]")
+    assert time.monotonic() - started < 1.0
+    assert (primary.cancelled, secondary.cancelled) == (1, 0)
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    broken, healthy = Stub("broken", error_rate=1), Stub("healthy")
+    router = LLMRouter([broken, healthy])
+
+    async def collect():
+        return "".join([chunk async for chunk in router.stream("prompt")])
+
+    assert asyncio.run(collect()).startswith("[stub]")
+    assert (broken.calls, healthy.calls) == (1, 1)
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from profiling import ProfilingMiddleware
+
+
+async def app(scope, receive, send):
+    await asyncio.sleep(0.02)
+    await send({"type": "http.response.start", "status": 201, "headers": []})
+    await send({"type": "http.response.body", "body": b"handler body"})
+
+
+def request(headers: dict) -> list:
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(name.encode(), value.encode()) for name, value in headers.items()]}
+    asyncio.run(ProfilingMiddleware(app, token="secret")(scope, None, send))
+    return sent
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"x-profile": "1"},
+    {"x-profile": "1", "x-admin-token": "wrong"},
+])
+def test_profile_requires_the_admin_token(headers):
+    start, body = request(headers)
+    assert start["status"] == 201
+    assert body["body"] == b"handler body"
+
+
+def test_profile_with_the_admin_token():
+    start, body = request({"x-profile": "1", "x-admin-token": "secret"})
+    headers = dict(start["headers"])
+    assert start["status"] == 200
+    assert headers[b"x-profile-status"] == b"201"
+    assert body["body"] != b"handler body"
@@ -0,0 +1,105 @@
+"""
+Bounded-memory handling of uploaded PDFs.
+
+UploadLimitMiddleware rejects request bodies over the configured size while
+they are still being received; batch uploads (POST /jobs) get a larger limit,
+since each of their files is checked against MAX_UPLOAD_BYTES when spooled. spool_upload then copies the upload to a named
+temp file in fixed-size chunks, hashing it on the way, so extraction workers
+can open it by path instead of receiving the bytes.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None
+
+
+def upload_too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {max_bytes} byte limit")
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        # path -> body limit for routes that take several files
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.path_limits.get(scope.get("path"), self.max_bytes)
+        if scope["type"] != "http" or not max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and int(content_length) > max_bytes:
+            error = upload_too_large(max_bytes)
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # FastAPI re-raises HTTPException from body parsing as-is
+                    raise upload_too_large(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class SpooledUpload:
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    @classmethod
+    def from_path(cls, path: str) -> "SpooledUpload":
+        """Re-reads a file spooled earlier, e.g. a batch job recovered after a restart."""
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                digest.update(chunk)
+        return cls(path, size, digest.hexdigest())
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES, directory: str = None) -> SpooledUpload:
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory or UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise upload_too_large(max_bytes)
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest())